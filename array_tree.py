@@ -0,0 +1,452 @@
+import math
+import random
+
+import numpy as np
+
+import utils
+import config
+
+
+class ArrayNode:
+    """
+    A view of one node of an ArrayMCTS, with the attributes of Node that the players use
+    """
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def move(self):
+        move_id = self.tree.move_ids[self.index]
+        if move_id < 0:
+            return None
+        return self.tree.move_table.moves[move_id]
+
+    @property
+    def visited_times(self):
+        return int(self.tree.visits[self.index])
+
+    @visited_times.setter
+    def visited_times(self, visited_times):
+        self.tree.visits[self.index] = visited_times
+
+    @property
+    def total_reward(self):
+        return float(self.tree.rewards[self.index])
+
+    @total_reward.setter
+    def total_reward(self, total_reward):
+        self.tree.rewards[self.index] = total_reward
+
+    @property
+    def child_nodes(self):
+        return [ArrayNode(self.tree, child) for child in self.tree.get_children(self.index)]
+
+    @property
+    def parent_node(self):
+        parent = self.tree.parent[self.index]
+        if parent < 0:
+            return None
+        return ArrayNode(self.tree, int(parent))
+
+    @parent_node.setter
+    def parent_node(self, parent_node):
+        self.tree.parent[self.index] = -1 if parent_node is None else parent_node.index
+
+    @property
+    def game_state(self):
+        """ The game state of the node, rebuilt by replaying the moves from the root """
+        return self.tree.get_game_state(self.index)
+
+    def expand(self):
+        self.tree.expand(self.index, self.tree.get_game_state(self.index))
+
+    def is_expanded(self):
+        return self.tree.number_of_children[self.index] > 0
+
+    def get_child_node(self, move):
+        """ Return the child node of a move, or None if move is not legal """
+        move_id = self.tree.move_table.ids[move]
+        for child in self.tree.get_children(self.index):
+            if self.tree.move_ids[child] == move_id:
+                return ArrayNode(self.tree, child)
+        return None
+
+
+class ArrayMCTS:
+    """
+    A Monte Carlo Search Tree stored as a struct of arrays, with the same search as MCTS
+
+    Node i has visits[i], rewards[i] (the total reward), priors[i], parent[i] and move_ids[i] (see utils.MoveTable),
+    and its children are the number_of_children[i] consecutive nodes from first_child[i]. The arrays grow by doubling.
+    Nodes do not keep game states, the game state of a node is rebuilt by replaying the moves from the root. ArrayNode
+    gives the Node interface used by the players.
+    """
+    # The per-node arrays and their types
+    fields = [
+        ('visits', np.int32),
+        ('rewards', np.float64),
+        ('priors', np.float32),
+        ('parent', np.int32),
+        ('first_child', np.int32),
+        ('number_of_children', np.int32),
+        ('move_ids', np.int32),
+    ]
+    # Each simulation backs up a single rollout
+    rollouts_per_leaf = 1
+
+    def __init__(self, root_game_state, player_id, capacity=1024):
+        self.move_table = utils.get_move_table(root_game_state.board_size)
+        self.size = 0
+        self.capacity = capacity
+        for name, dtype in self.fields:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.root = self.add_nodes(-1, 1)
+        self.root_game_state = root_game_state
+        self.transposition_table = None
+        self.expand(self.root, root_game_state)
+        # Player id of the agent, not the current player of each node
+        self.player_id = player_id
+
+    @property
+    def root_node(self):
+        return ArrayNode(self, self.root)
+
+    @root_node.setter
+    def root_node(self, node):
+        """ Move the root to node, the nodes outside of its subtree stay in the arrays but are no longer searched """
+        self.root_game_state = self.get_game_state(node.index)
+        self.root = node.index
+        self.parent[self.root] = -1
+
+    def add_nodes(self, parent, number_of_nodes):
+        """ Append number_of_nodes empty children of parent to the arrays, and return the index of the first one """
+        if self.size + number_of_nodes > self.capacity:
+            self.capacity = max(2 * self.capacity, self.size + number_of_nodes)
+            for name, dtype in self.fields:
+                array = np.zeros(self.capacity, dtype=dtype)
+                array[:self.size] = getattr(self, name)[:self.size]
+                setattr(self, name, array)
+        first = self.size
+        self.size += number_of_nodes
+        self.parent[first:self.size] = parent
+        self.first_child[first:self.size] = -1
+        self.move_ids[first:self.size] = -1
+        return first
+
+    def get_children(self, index):
+        first = int(self.first_child[index])
+        return range(first, first + int(self.number_of_children[index]))
+
+    def get_move(self, index):
+        return self.move_table.moves[self.move_ids[index]]
+
+    def get_game_state(self, index):
+        """ Return a new game state of a node, by replaying the moves from the root """
+        moves = []
+        while index != self.root:
+            moves.append(self.get_move(index))
+            index = self.parent[index]
+        game_state = self.root_game_state.clone()
+        for move in reversed(moves):
+            game_state.apply_legal_move(move[0], move[1])
+        return game_state
+
+    def expand(self, index, game_state):
+        """ Create the child nodes of a node, game_state is the game state of the node """
+        if self.number_of_children[index] or game_state.winner is not None:
+            return
+        legal_moves = game_state.get_legal_moves()
+        first = self.add_nodes(index, len(legal_moves))
+        self.move_ids[first:self.size] = self.move_table.get_ids(legal_moves)
+        self.priors[first:self.size] = 1 / len(legal_moves)
+        self.first_child[index] = first
+        self.number_of_children[index] = len(legal_moves)
+        self.initialize_children(first, game_state, legal_moves)
+
+    def initialize_children(self, first, game_state, legal_moves):
+        """ Set the initial statistics of the new children first, first + 1, ... of a node, nothing by default """
+        pass
+
+    def compute_UCB1(self, index):
+        """ Return the UCB1 values of the children of a node, as an array """
+        children = slice(self.first_child[index], self.first_child[index] + self.number_of_children[index])
+        visits = self.visits[children]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            UCB1 = self.rewards[children] / visits + config.exploration_weight * np.sqrt(math.log(max(self.visits[index], 1)) / visits)
+        UCB1[visits == 0] = math.inf
+        return UCB1
+
+    def selection(self):
+        """
+        Return the leaf node with the best UCB1 along the path, and its game state
+        """
+        index = self.root
+        game_state = self.root_game_state.clone()
+        while self.number_of_children[index]:
+            index = int(self.first_child[index] + np.argmax(self.compute_UCB1(index)))
+            move = self.get_move(index)
+            game_state.apply_legal_move(move[0], move[1])
+        return index, game_state
+
+    def is_full(self):
+        """ Return True if the tree has reached its node budget (see utils.get_node_budget()), then no nodes are created """
+        node_budget = utils.get_node_budget(self.get_bytes_per_node())
+        return node_budget is not None and self.size >= node_budget
+
+    def get_number_of_nodes(self):
+        """ Return the number of nodes in the arrays, the nodes outside of the subtree of the root node are only dropped by move_root() """
+        return self.size
+
+    def move_root(self, node):
+        """
+        Make node, a node in the subtree of the root node, the root node, and return the number of nodes released
+
+        The subtree of node is moved to the front of the arrays in breadth-first order, which keeps the children of each
+        node consecutive, and the other nodes are dropped so that their space is reused.
+        """
+        self.root_node = node
+        order = [self.root]
+        i = 0
+        while i < len(order):
+            order.extend(self.get_children(order[i]))
+            i += 1
+        order = np.array(order, dtype=np.int64)
+        new_index = np.full(self.size, -1, dtype=np.int64)
+        new_index[order] = np.arange(len(order))
+        for name, dtype in self.fields:
+            array = getattr(self, name)
+            array[:len(order)] = array[order]
+            # add_nodes() expects the space after the nodes to be zeros
+            array[len(order):self.size] = 0
+        number_of_children = self.number_of_children[:len(order)]
+        self.first_child[:len(order)] = np.where(number_of_children > 0, new_index[np.maximum(self.first_child[:len(order)], 0)], -1)
+        self.parent[1:len(order)] = new_index[self.parent[1:len(order)]]
+        self.parent[0] = -1
+        released = self.size - len(order)
+        self.root = 0
+        self.size = len(order)
+        return released
+
+    def count_nodes(self):
+        """ Return the number of nodes reachable from the root node """
+        count = 0
+        stack = [self.root]
+        while stack:
+            children = self.get_children(stack.pop())
+            count += 1
+            stack.extend(children)
+        return count
+
+    def get_bytes_per_node(self):
+        return sum(np.dtype(dtype).itemsize for name, dtype in self.fields)
+
+    def get_nbytes(self):
+        """ Return the number of bytes used by the nodes in the arrays """
+        return self.get_bytes_per_node() * self.size
+
+    def get_proven_win_node(self):
+        """ Return a child node of the root node that is proven to win, or None. Only ArrayMCTSSolver proves wins """
+        return None
+
+    def get_best_node(self):
+        """ Get the best child node of root node. Used for making the real move. """
+        children = self.get_children(self.root)
+        visits = self.visits[children.start:children.stop]
+        visited = np.flatnonzero(visits)
+        if len(visited) == 0:
+            return ArrayNode(self, children.start)
+        average_rewards = self.rewards[children.start:children.stop][visited] / visits[visited]
+        return ArrayNode(self, children.start + int(visited[np.argmax(average_rewards)]))
+
+    def expand_leaf(self, index, game_state):
+        """ Expand a visited leaf that is not terminal and move to its first child, return the new leaf """
+        if self.visits[index] != 0 and game_state.winner is None and not self.is_full():
+            self.expand(index, game_state)
+            index = int(self.first_child[index])
+            move = self.get_move(index)
+            game_state.apply_legal_move(move[0], move[1])
+        return index
+
+    def simulation(self):
+        """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
+        index, game_state = self.selection()
+        index = self.expand_leaf(index, game_state)
+        reward = self.rollout(game_state)
+        self.back_propagation(index, reward)
+
+    def rollout(self, game_state):
+        """
+        Plays a full game from game_state with random actions, game_state is changed
+
+        Return the reward. (-1 if leaf node's current player wins, 0 is draw, 1 if leaf node's current player losses)
+        """
+        current_player = game_state.current_player
+        winner = game_state.play_random_game()
+        if winner == current_player:
+            return -1
+        elif winner == 0:
+            return 0
+        else:
+            return 1
+
+    def back_propagation(self, index, reward):
+        """ Update the visits and rewards of a node and its ancestors, up to the root node """
+        visits, rewards, parent = self.visits, self.rewards, self.parent
+        while index >= 0:
+            visits[index] += 1
+            rewards[index] += reward
+            reward = -reward
+            index = parent[index]
+
+
+class ArrayMCTSSolver(ArrayMCTS):
+    """
+    An ArrayMCTS with the proofs of MCTSSolver
+
+    The total reward of a node becomes +math.inf if it is a proven win for the player who moved into it, and -math.inf if
+    it is a proven loss. lost_children[i] is the number of children of node i that are proven losses.
+    """
+    fields = ArrayMCTS.fields + [
+        ('lost_children', np.int32),
+    ]
+
+    def __init__(self, root_game_state, player_id, capacity=1024):
+        # The child of the root node that is proven to win, or -1, see get_proven_win_node()
+        self.proven_child = -1
+        super().__init__(root_game_state, player_id, capacity)
+
+    def initialize_children(self, first, game_state, legal_moves):
+        """ A move that wins the game is a proven win """
+        for i, move in enumerate(legal_moves):
+            game_state.push(move)
+            if game_state.winner is not None and game_state.winner != 0:
+                self.rewards[first + i] = math.inf
+                self.visits[first + i] = 1
+                if self.parent[first] == self.root:
+                    self.proven_child = first + i
+            game_state.pop()
+
+    def move_root(self, node):
+        """ See ArrayMCTS.move_root(), the proven child of the new root node is looked up once """
+        released = super().move_root(node)
+        children = self.get_children(self.root)
+        proven = np.flatnonzero(self.rewards[children.start:children.stop] == math.inf)
+        self.proven_child = children.start + int(proven[0]) if len(proven) else -1
+        return released
+
+    def get_proven_win_node(self):
+        if self.proven_child < 0:
+            return None
+        return ArrayNode(self, self.proven_child)
+
+    def simulation(self):
+        """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
+        index, game_state = self.selection()
+        index = self.expand_leaf(index, game_state)
+        reward = self.rewards[index]
+        if reward != math.inf and reward != -math.inf:
+            reward = self.rollout(game_state)
+        self.back_propagation(index, reward)
+
+    def back_propagation(self, index, reward):
+        """ The back propagation of MCTSSolverNode, one node at a time up to the root node """
+        visits, rewards, parent = self.visits, self.rewards, self.parent
+        while index >= 0:
+            visits[index] += 1
+            if reward == math.inf:
+                # To prove a loss, we need to prove that all children are loss
+                if self.lost_children[index] < self.number_of_children[index]:
+                    rewards[index] += -1
+                    reward = -1
+                else:
+                    rewards[index] = reward
+                    if parent[index] == self.root:
+                        self.proven_child = index
+                    reward = -reward
+            elif reward == -math.inf:
+                # To prove a win, we only need one child to be a win
+                if rewards[index] != -math.inf and parent[index] >= 0:
+                    self.lost_children[parent[index]] += 1
+                rewards[index] = reward
+                reward = -reward
+            else:
+                rewards[index] += reward
+                reward = -reward
+            index = parent[index]
+
+
+class ArrayMCRAVE(ArrayMCTS):
+    """
+    An ArrayMCTS with the AMAF statistics and the UCB1 of MCRAVE
+
+    amaf_counts[i] and amaf_values[i] are the AMAF statistics of the move of node i at its parent, the same as the
+    amaf_counts and amaf_values of the parent in MCRAVENode.
+    """
+    fields = ArrayMCTS.fields + [
+        ('amaf_counts', np.int32),
+        ('amaf_values', np.float64),
+    ]
+
+    def compute_UCB1(self, index):
+        """ Return the modified UCB1 values of the children of a node, as an array """
+        children = slice(self.first_child[index], self.first_child[index] + self.number_of_children[index])
+        visits = self.visits[children]
+        amaf_counts = self.amaf_counts[children]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average_rewards = self.rewards[children] / visits
+            beta = amaf_counts / (visits + amaf_counts + 4 * visits * amaf_counts * 0.2)
+            values = np.where(amaf_counts == 0, average_rewards,
+                              (1 - beta) * average_rewards + beta * (self.amaf_values[children] / amaf_counts))
+            UCB1 = values + config.exploration_weight * np.sqrt(math.log(max(self.visits[index], 1)) / visits)
+        UCB1[visits == 0] = math.inf
+        return UCB1
+
+    def simulation(self):
+        """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
+        index, game_state = self.selection()
+        index = self.expand_leaf(index, game_state)
+        current_player = game_state.current_player
+        reward, action_ids = self.rollout(game_state)
+        if current_player == self.player_id:
+            self.back_propagation(index, -reward, action_ids)
+        else:
+            self.back_propagation(index, reward, action_ids)
+
+    def rollout(self, game_state):
+        """
+        Plays a full game from game_state with random actions, game_state is changed
+
+        Return the reward (1 if this agent wins, 0 is draw, -1 if this agent losses) and the ids of the moves of this agent
+        """
+        action_ids = []
+        while game_state.winner is None:
+            current_player = game_state.current_player
+            main_board_coor, sub_board_coor = random.choice(game_state.get_legal_moves())
+            game_state.apply_legal_move(main_board_coor, sub_board_coor)
+            # Only append actions made by this AI
+            if current_player == self.player_id:
+                action_ids.append(self.move_table.ids[(main_board_coor, sub_board_coor)])
+        if game_state.winner == self.player_id:
+            return 1, action_ids
+        elif game_state.winner == 0:
+            return 0, action_ids
+        else:
+            return -1, action_ids
+
+    def back_propagation(self, index, reward, action_ids):
+        """ Update the visits and rewards of a node and its ancestors, and the AMAF statistics of their children """
+        # played[move_id] is True for the moves of action_ids, so the children of a node are looked up in one step
+        played = np.zeros(self.move_table.number_of_moves, dtype=bool)
+        played[action_ids] = True
+        visits, rewards, parent = self.visits, self.rewards, self.parent
+        while index >= 0:
+            visits[index] += 1
+            rewards[index] += reward
+            first = self.first_child[index]
+            if self.number_of_children[index]:
+                played_children = first + np.flatnonzero(played[self.move_ids[first:first + self.number_of_children[index]]])
+                self.amaf_counts[played_children] += 1
+                self.amaf_values[played_children] += reward
+            reward = -reward
+            index = parent[index]
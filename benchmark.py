@@ -0,0 +1,222 @@
+import argparse
+from copy import deepcopy
+import random
+import sys
+import time
+import tracemalloc
+
+from main_board import MainBoard
+from bitboard import BitBoard, get_tables
+from sub_board import get_lines_through
+from sub_board_table import get_sub_board_table
+from zobrist import get_zobrist_keys
+from monte_carlo_tree_search import MCTS, Node
+from mcts_solver import MCTSSolver
+from mc_rave import MCRAVE
+from score_bounded_mcts import ScoreBoundedMCTS
+from array_tree import ArrayMCTS, ArrayMCTSSolver, ArrayMCRAVE
+from transposition_table import TranspositionTable
+import config
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks of the game state and the search")
+
+    parser.add_argument('benchmark',
+                        help="Benchmark to run.",
+                        choices=['clone', 'rollout', 'transposition', 'tree', 'threads', 'solver'])
+
+    parser.add_argument('-b',
+                        '--board_size',
+                        help="Board Size. Default 3.",
+                        type=int,
+                        default=config.board_size)
+
+    parser.add_argument('-d',
+                        '--duration',
+                        help="Seconds to spend on each measurement.",
+                        type=float,
+                        default=2)
+
+    parser.add_argument('-s',
+                        '--number_of_simulations',
+                        help="Number of simulations for the search benchmarks.",
+                        type=int,
+                        default=config.number_of_simulations)
+    return parser
+
+
+def random_position(board_class, board_size, number_of_moves, seed=0):
+    """ Return a game state after playing number_of_moves random moves (fewer if the game ends) """
+    rng = random.Random(seed)
+    game_state = board_class(board_size)
+    for _ in range(number_of_moves):
+        if game_state.winner is not None:
+            break
+        game_state.apply_legal_move(*rng.choice(game_state.get_legal_moves()))
+    return game_state
+
+
+def rate(function, duration):
+    """ Return how many times per second function can be called """
+    count = 0
+    start_time = time.time()
+    while time.time() - start_time < duration:
+        function()
+        count += 1
+    return count / (time.time() - start_time)
+
+
+def get_shared_tables(game_state):
+    """ Return the lookup tables that every game state of a board size shares, and that clone() does not copy """
+    board_size = game_state.board_size
+    tables = [get_zobrist_keys(board_size), get_lines_through(board_size), get_sub_board_table(board_size)]
+    if isinstance(game_state, BitBoard):
+        tables += get_tables(board_size).values()
+    return tables
+
+
+def generic_deepcopy(game_state, shared_tables):
+    """
+    Return a deepcopy of game_state that does not use its __deepcopy__(), which BitBoard maps to clone()
+
+    The shared tables are entered in the memo, so only the state of the game is copied, like clone() does.
+    """
+    memo = {id(table): table for table in shared_tables}
+    game_state_copy = game_state.__class__.__new__(game_state.__class__)
+    game_state_copy.__dict__.update(deepcopy(game_state.__dict__, memo))
+    return game_state_copy
+
+
+def benchmark_clone(board_size, duration):
+    for board_class in (MainBoard, BitBoard):
+        game_state = random_position(board_class, board_size, 20)
+        shared_tables = get_shared_tables(game_state)
+        deepcopy_rate = rate(lambda: generic_deepcopy(game_state, shared_tables), duration)
+        clone_rate = rate(game_state.clone, duration)
+        print(board_class.__name__)
+        print("  deepcopy per second: ", round(deepcopy_rate))
+        print("  clone per second:    ", round(clone_rate))
+        print("  speedup:             ", round(clone_rate / deepcopy_rate, 1))
+
+
+def benchmark_rollout(board_size, duration):
+    for board_class in (MainBoard, BitBoard):
+        node = Node(board_class(board_size), None, 1)
+        print(board_class.__name__)
+        print("  rollouts per second: ", round(rate(node.rollout, duration)))
+
+
+def benchmark_transposition(board_size, number_of_simulations):
+    for tree_class in (MCTS, MCTSSolver):
+        for transposition_table in (None, TranspositionTable()):
+            random.seed(0)
+            tree = tree_class(random_position(MainBoard, board_size, 10), 1, transposition_table)
+            start_time = time.time()
+            for _ in range(number_of_simulations):
+                tree.simulation()
+            used_time = time.time() - start_time
+            print(tree_class.__name__, "with" if transposition_table is not None else "without", "transposition table")
+            print("  simulations per second: ", round(number_of_simulations / used_time))
+            print("  nodes:                  ", tree.count_nodes())
+            if transposition_table is not None:
+                print("  shared node hits:       ", transposition_table.hits)
+
+
+def benchmark_tree(board_size, number_of_simulations):
+    for tree_classes in ((MCTS, ArrayMCTS), (MCTSSolver, ArrayMCTSSolver), (MCRAVE, ArrayMCRAVE)):
+        for tree_class in tree_classes:
+            root_game_state = random_position(MainBoard, board_size, 10)
+            # Speed and memory are measured in separate runs, as tracemalloc slows the search down
+            random.seed(0)
+            tree = tree_class(root_game_state.clone(), 1)
+            start_time = time.time()
+            for _ in range(number_of_simulations):
+                tree.simulation()
+            used_time = time.time() - start_time
+
+            random.seed(0)
+            tracemalloc.start()
+            tree = tree_class(root_game_state.clone(), 1)
+            for _ in range(number_of_simulations):
+                tree.simulation()
+            used_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            number_of_nodes = tree.count_nodes()
+            print(tree_class.__name__)
+            print("  simulations per second: ", round(number_of_simulations / used_time))
+            print("  nodes per second:       ", round(number_of_nodes / used_time))
+            print("  nodes:                  ", number_of_nodes)
+            print("  bytes per node:         ", round(used_memory / number_of_nodes))
+
+
+def benchmark_threads(board_size, number_of_simulations):
+    # sys._is_gil_enabled() only exists from Python 3.13, earlier versions always have the GIL
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print("GIL enabled:", gil_enabled)
+    for tree_class in (MCTS, MCTSSolver):
+        print(tree_class.__name__)
+        for threads in (1, 2, 4, 8):
+            random.seed(0)
+            tree = tree_class(random_position(BitBoard, board_size, 10), 1)
+            start_time = time.time()
+            tree.run_tree_parallel(threads, number_of_simulations)
+            used_time = time.time() - start_time
+            print("  " + str(threads) + " thread(s), simulations per second: ", round(number_of_simulations / used_time))
+
+
+def benchmark_solver(board_size, number_of_simulations):
+    """
+    Search late random positions with each solver until the root node is solved, or for number_of_simulations
+    simulations, and report the solved positions per second and their results for the player to move
+    """
+    positions = []
+    seed = 0
+    while len(positions) < 50:
+        game_state = random_position(MainBoard, board_size, 45 + seed % 15, seed)
+        seed += 1
+        if game_state.winner is None:
+            positions.append(game_state)
+    for tree_class in (MCTSSolver, ScoreBoundedMCTS):
+        random.seed(0)
+        results = {'win': 0, 'draw': 0, 'loss': 0}
+        simulations = 0
+        start_time = time.time()
+        for game_state in positions:
+            tree = tree_class(game_state.clone(), game_state.current_player)
+            for _ in range(number_of_simulations):
+                if tree.is_solved():
+                    break
+                tree.simulation()
+                simulations += 1
+            score = tree.get_root_score()
+            if score is not None:
+                results[{1: 'win', 0: 'draw', -1: 'loss'}[score]] += 1
+        used_time = time.time() - start_time
+        solved = sum(results.values())
+        print(tree_class.__name__)
+        print("  solved positions:           ", solved, "of", len(positions), results)
+        print("  solved positions per second:", round(solved / used_time, 2))
+        print("  simulations per second:     ", round(simulations / used_time))
+
+
+def main():
+    args = get_parser().parse_args()
+    random.seed(0)
+    if args.benchmark == 'clone':
+        benchmark_clone(args.board_size, args.duration)
+    elif args.benchmark == 'rollout':
+        benchmark_rollout(args.board_size, args.duration)
+    elif args.benchmark == 'transposition':
+        benchmark_transposition(args.board_size, args.number_of_simulations)
+    elif args.benchmark == 'tree':
+        benchmark_tree(args.board_size, args.number_of_simulations)
+    elif args.benchmark == 'threads':
+        benchmark_threads(args.board_size, args.number_of_simulations)
+    elif args.benchmark == 'solver':
+        benchmark_solver(args.board_size, args.number_of_simulations)
+
+
+if __name__ == "__main__":
+    main()
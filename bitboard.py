@@ -0,0 +1,492 @@
+import random
+
+import numpy as np
+
+from main_board import MainBoard
+from sub_board_table import get_sub_board_table
+from zobrist import get_zobrist_keys
+import config
+
+# Precomputed masks and coordinates for every board size in use, see get_tables()
+_tables = {}
+
+
+def get_tables(board_size):
+    """
+    Return the lookup tables of a board size, building them on first use
+
+    Cells and sub-boards are numbered x * board_size + y, and cell i of a sub-board is bit i of its mask.
+    """
+    if board_size not in _tables:
+        n = board_size
+        lines = []
+        for i in range(n):
+            # Row and column
+            lines.append(sum(1 << (i * n + j) for j in range(n)))
+            lines.append(sum(1 << (j * n + i) for j in range(n)))
+        # Diagonals
+        lines.append(sum(1 << (i * n + i) for i in range(n)))
+        lines.append(sum(1 << (i * n + n - 1 - i) for i in range(n)))
+        lines_through = [[line for line in lines if line >> i & 1] for i in range(n * n)]
+        coors = [(i // n, i % n) for i in range(n * n)]
+        moves = [[(main_coor, sub_coor) for sub_coor in coors] for main_coor in coors]
+        _tables[board_size] = {
+            'full': (1 << (n * n)) - 1,
+            'lines': lines,
+            'lines_through': lines_through,
+            'coors': coors,
+            'moves': moves,
+            # Filled lazily by BitBoard.get_sub_board_moves() and BitBoard.get_empty_cells()
+            'sub_board_moves': {},
+            'empty_cells': {},
+        }
+    return _tables[board_size]
+
+
+class BitBoard:
+    """
+    A bitboard implementation of the main board, with the same interface as MainBoard
+
+    Each player has one integer mask per sub-board, and the won, drawn and allowed sub-boards are masks over the
+    sub-boards. Sub-board and cell coordinates are the same as in MainBoard.
+    """
+
+    def __init__(self, board_size = config.board_size):
+        self.board_size = board_size
+        tables = get_tables(board_size)
+        self.full = tables['full']
+        self.lines = tables['lines']
+        self.lines_through = tables['lines_through']
+        self.coors = tables['coors']
+        self.moves = tables['moves']
+        self.sub_board_moves = tables['sub_board_moves']
+        self.empty_cells = tables['empty_cells']
+        self.cells_per_sub_board = board_size * board_size
+        # Outcomes and winning cells of sub-board states, None for board sizes without a table
+        self.table = get_sub_board_table(board_size)
+        number_of_sub_boards = board_size * board_size
+        # player_masks[0] holds the cells of player 1, player_masks[1] the cells of player 2
+        self.player_masks = [[0] * number_of_sub_boards, [0] * number_of_sub_boards]
+        # won_masks[0] holds the sub-boards won by player 1, won_masks[1] the ones won by player 2
+        self.won_masks = [0, 0]
+        self.drawn_mask = 0
+        self.allowed_mask = self.full
+        self.winner = None
+        self.current_move = 0
+        self.current_player = 1
+        # Zobrist key of the cells and the player to move, see zobrist_key
+        self.zobrist_keys = get_zobrist_keys(board_size)
+        self.cells_key = 0
+        # Input array of the neural network, see get_features()
+        self.features = None
+        # One entry per move made with push(), see pop()
+        self.undo_stack = []
+
+    @classmethod
+    def from_main_board(cls, main_board):
+        """ Return a BitBoard of the same game state as a MainBoard """
+        board = cls(main_board.board_size)
+        n = main_board.board_size
+        for s, (x, y) in enumerate(board.coors):
+            sub_board = main_board.sub_boards[x][y]
+            for c, (i, j) in enumerate(board.coors):
+                if sub_board.cells[i][j] is not None:
+                    board.player_masks[sub_board.cells[i][j] - 1][s] |= 1 << c
+            value = main_board.sub_board_values[x][y]
+            if value == 0:
+                board.drawn_mask |= 1 << s
+            elif value is not None:
+                board.won_masks[value - 1] |= 1 << s
+        board.allowed_mask = 0
+        for x, y in main_board.allowed_sub_boards:
+            board.allowed_mask |= 1 << (x * n + y)
+        board.cells_key = main_board.cells_key
+        board.winner = main_board.winner
+        board.current_move = main_board.current_move
+        board.current_player = main_board.current_player
+        if main_board.features is not None:
+            # Both boards number the cells of the features the same way
+            board.features = main_board.features.copy()
+        return board
+
+    def clone(self):
+        """ Return a copy of this game state, only the mutable masks are copied and the lookup tables are shared """
+        board = BitBoard.__new__(BitBoard)
+        board.__dict__.update(self.__dict__)
+        board.player_masks = [self.player_masks[0][:], self.player_masks[1][:]]
+        board.won_masks = self.won_masks[:]
+        board.features = self.features.copy() if self.features is not None else None
+        board.undo_stack = self.undo_stack[:]
+        return board
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    @property
+    def allowed_sub_boards(self):
+        return {self.coors[s] for s in range(self.board_size * self.board_size) if self.allowed_mask >> s & 1}
+
+    @property
+    def zobrist_key(self):
+        """ The Zobrist key of the position, the same as the one of MainBoard """
+        key = self.cells_key
+        allowed = self.allowed_mask
+        while allowed:
+            lowest = allowed & -allowed
+            key ^= self.zobrist_keys.allowed_sub_boards[lowest.bit_length() - 1]
+            allowed ^= lowest
+        return key
+
+    @property
+    def sub_board_values(self):
+        values = [[None for column in range(self.board_size)] for row in range(self.board_size)]
+        for s, (x, y) in enumerate(self.coors):
+            if self.won_masks[0] >> s & 1:
+                values[x][y] = 1
+            elif self.won_masks[1] >> s & 1:
+                values[x][y] = 2
+            elif self.drawn_mask >> s & 1:
+                values[x][y] = 0
+        return values
+
+    def get_cell(self, main_board_coor, sub_board_coor):
+        """ Return the player occupying a cell, or None if it is empty """
+        s = main_board_coor[0] * self.board_size + main_board_coor[1]
+        c = sub_board_coor[0] * self.board_size + sub_board_coor[1]
+        if self.player_masks[0][s] >> c & 1:
+            return 1
+        if self.player_masks[1][s] >> c & 1:
+            return 2
+        return None
+
+    def make_move(self, main_board_coor, sub_board_coor):
+        """ If a move is made successfully, return True, else return False """
+        n = self.board_size
+        if not (0 <= main_board_coor[0] < n and 0 <= main_board_coor[1] < n and 0 <= sub_board_coor[0] < n and 0 <= sub_board_coor[1] < n):
+            print("Move out of boundary")
+            return False
+        s = main_board_coor[0] * n + main_board_coor[1]
+        if not self.allowed_mask >> s & 1:
+            print("Invalid Sub-board")
+            return False
+        c = sub_board_coor[0] * n + sub_board_coor[1]
+        if (self.player_masks[0][s] | self.player_masks[1][s]) >> c & 1:
+            print("Cell occupied")
+            return False
+        self.apply_legal_move(main_board_coor, sub_board_coor)
+        return True
+
+    def apply_legal_move(self, main_board_coor, sub_board_coor):
+        """ Make a move without any check or output, the same as MainBoard.apply_legal_move() """
+        n = self.board_size
+        self.apply_cell(main_board_coor[0] * n + main_board_coor[1], sub_board_coor[0] * n + sub_board_coor[1])
+
+    def apply_cell(self, s, c):
+        """ Make the move on cell c of sub-board s, see apply_legal_move() """
+        player = self.current_player
+        self.cells_key ^= self.zobrist_keys.moves[player - 1][s * self.cells_per_sub_board + c]
+        masks = self.player_masks[player - 1]
+        mask = masks[s] | 1 << c
+        masks[s] = mask
+        for line in self.lines_through[c]:
+            if mask & line == line:
+                # The sub-board is won, check the lines of the main board through it
+                won = self.won_masks[player - 1] | 1 << s
+                self.won_masks[player - 1] = won
+                for main_line in self.lines_through[s]:
+                    if won & main_line == main_line:
+                        self.winner = player
+                break
+        else:
+            if mask | self.player_masks[2 - player][s] == self.full:
+                self.drawn_mask |= 1 << s
+
+        decided = self.won_masks[0] | self.won_masks[1] | self.drawn_mask
+        if self.winner is None and decided >> s & 1 and not self.has_open_line(self.won_masks[0], self.won_masks[1], self.drawn_mask):
+            # No line can be completed any more, this includes a full main board
+            self.winner = 0
+        previous_allowed_mask = self.allowed_mask
+        if decided >> c & 1:
+            self.allowed_mask = self.full & ~decided
+        else:
+            self.allowed_mask = 1 << c
+        self.current_move += 1
+        self.current_player = 3 - player
+        if self.features is not None:
+            self.update_features(s * self.cells_per_sub_board + c, player, 1, previous_allowed_mask)
+
+    def has_open_line(self, won_mask_1, won_mask_2, drawn_mask):
+        """ Return True if a line of the main board has no drawn sub-board and is not shared by both players, see MainBoard.is_line_blocked() """
+        for line in self.lines:
+            if not line & drawn_mask and not (line & won_mask_1 and line & won_mask_2):
+                return True
+        return False
+
+    def blocks_all_lines(self, s, sub_board_value):
+        """ Return True if deciding the open sub-board s with sub_board_value would block the last lines """
+        won_masks = self.won_masks[:]
+        drawn_mask = self.drawn_mask
+        if sub_board_value == 0:
+            drawn_mask |= 1 << s
+        else:
+            won_masks[sub_board_value - 1] |= 1 << s
+        return not self.has_open_line(won_masks[0], won_masks[1], drawn_mask)
+
+    def get_winning_cells(self, s, player):
+        """ Return the mask of the empty cells on which player would win sub-board s, 0 if it is decided """
+        mask_1, mask_2 = self.player_masks[0][s], self.player_masks[1][s]
+        if self.table is not None:
+            return self.table.winning_cells[player - 1][self.table.ternary[mask_1] + 2 * self.table.ternary[mask_2]]
+        if (self.won_masks[0] | self.won_masks[1] | self.drawn_mask) >> s & 1:
+            return 0
+        mask = mask_1 if player == 1 else mask_2
+        empty = self.full & ~(mask_1 | mask_2)
+        winning_cells = 0
+        for c in range(self.cells_per_sub_board):
+            if empty >> c & 1 and any((mask | 1 << c) & line == line for line in self.lines_through[c]):
+                winning_cells |= 1 << c
+        return winning_cells
+
+    def can_end_game(self):
+        """ Return True if the player to move has a move that ends the game, the same as MainBoard.can_end_game() """
+        if self.winner is not None:
+            return False
+        player = self.current_player
+        open_mask = self.full & ~(self.won_masks[0] | self.won_masks[1] | self.drawn_mask)
+        last = open_mask & (open_mask - 1) == 0
+        allowed = self.allowed_mask
+        while allowed:
+            lowest = allowed & -allowed
+            s = lowest.bit_length() - 1
+            allowed ^= lowest
+            if self.get_winning_cells(s, player):
+                if last or self.blocks_all_lines(s, player):
+                    return True
+                won = self.won_masks[player - 1] | lowest
+                if any(won & line == line for line in self.lines_through[s]):
+                    return True
+            else:
+                # The only move left on the sub-board fills it
+                empty = self.full & ~(self.player_masks[0][s] | self.player_masks[1][s])
+                if empty & (empty - 1) == 0 and (last or self.blocks_all_lines(s, 0)):
+                    return True
+        return False
+
+    def push(self, move):
+        """ Make a legal move that can be taken back with pop(), without any check like apply_legal_move() """
+        self.undo_stack.append((move, self.allowed_mask, self.won_masks[self.current_player - 1], self.drawn_mask, self.winner))
+        self.apply_legal_move(move[0], move[1])
+
+    def pop(self):
+        """ Take back the last move made with push(), and return it """
+        previous_allowed_mask = self.allowed_mask
+        move, self.allowed_mask, won_mask, self.drawn_mask, self.winner = self.undo_stack.pop()
+        player = 3 - self.current_player
+        s = move[0][0] * self.board_size + move[0][1]
+        self.player_masks[player - 1][s] &= ~(1 << (move[1][0] * self.board_size + move[1][1]))
+        self.won_masks[player - 1] = won_mask
+        self.cells_key ^= self.zobrist_keys.moves[player - 1][s * self.cells_per_sub_board + move[1][0] * self.board_size + move[1][1]]
+        self.current_move -= 1
+        self.current_player = player
+        if self.features is not None:
+            self.update_features(s * self.cells_per_sub_board + move[1][0] * self.board_size + move[1][1], player, 0, previous_allowed_mask)
+        return move
+
+    def get_legal_moves(self):
+        """ Return all legal moves """
+        if self.winner is not None:
+            return []
+        allowed = self.allowed_mask
+        if allowed & (allowed - 1) == 0:
+            # Only one sub-board is allowed, which is the common case
+            return list(self.get_sub_board_moves(allowed.bit_length() - 1))
+        possible_moves = []
+        while allowed:
+            lowest = allowed & -allowed
+            s = lowest.bit_length() - 1
+            allowed ^= lowest
+            possible_moves.extend(self.get_sub_board_moves(s))
+        return possible_moves
+
+    def get_sub_board_moves(self, s):
+        """ Return the moves on the empty cells of sub-board s as a tuple, cached per (sub-board, occupied mask) """
+        occupied = self.player_masks[0][s] | self.player_masks[1][s]
+        key = s << self.cells_per_sub_board | occupied
+        moves = self.sub_board_moves.get(key)
+        if moves is None:
+            row = self.moves[s]
+            moves = tuple(row[c] for c in range(self.cells_per_sub_board) if not occupied >> c & 1)
+            self.sub_board_moves[key] = moves
+        return moves
+
+    def get_empty_cells(self, s):
+        """ Return the indices of the empty cells of sub-board s as a tuple, cached per occupied mask """
+        occupied = self.player_masks[0][s] | self.player_masks[1][s]
+        cells = self.empty_cells.get(occupied)
+        if cells is None:
+            cells = tuple(c for c in range(self.cells_per_sub_board) if not occupied >> c & 1)
+            self.empty_cells[occupied] = cells
+        return cells
+
+    def play_random_game(self):
+        """
+        Play uniformly random legal moves until the game ends and return the winner, the same as
+        MainBoard.play_random_game()
+
+        The moves are drawn from the empty cells of the allowed sub-boards without building the legal moves, and the
+        state is kept in local variables and stored back when the game ends. The features are kept up to date move by
+        move through apply_cell().
+        """
+        if self.features is not None:
+            while self.winner is None:
+                s, c = self.get_random_cell()
+                self.apply_cell(s, c)
+            return self.winner
+        full = self.full
+        lines = self.lines
+        lines_through = self.lines_through
+        empty_cells = self.empty_cells
+        move_keys = self.zobrist_keys.moves
+        cells_per_sub_board = self.cells_per_sub_board
+        player_masks = self.player_masks
+        won_masks = self.won_masks
+        drawn_mask = self.drawn_mask
+        allowed = self.allowed_mask
+        player = self.current_player
+        cells_key = self.cells_key
+        winner = self.winner
+        number_of_moves = 0
+        rand = random.random
+        while winner is None:
+            if allowed & (allowed - 1) == 0:
+                # Only one sub-board is allowed, which is the common case
+                s = allowed.bit_length() - 1
+                occupied = player_masks[0][s] | player_masks[1][s]
+                cells = empty_cells.get(occupied)
+                if cells is None:
+                    cells = self.get_empty_cells(s)
+                c = cells[int(rand() * len(cells))]
+            else:
+                self.allowed_mask = allowed
+                s, c = self.get_random_cell()
+            cells_key ^= move_keys[player - 1][s * cells_per_sub_board + c]
+            masks = player_masks[player - 1]
+            mask = masks[s] | 1 << c
+            masks[s] = mask
+            for line in lines_through[c]:
+                if mask & line == line:
+                    # The sub-board is won, check the lines of the main board through it
+                    won = won_masks[player - 1] | 1 << s
+                    won_masks[player - 1] = won
+                    for main_line in lines_through[s]:
+                        if won & main_line == main_line:
+                            winner = player
+                    break
+            else:
+                if mask | player_masks[2 - player][s] == full:
+                    drawn_mask |= 1 << s
+            decided = won_masks[0] | won_masks[1] | drawn_mask
+            if decided >> s & 1 and winner is None:
+                won_mask_1, won_mask_2 = won_masks
+                for line in lines:
+                    if not line & drawn_mask and not (line & won_mask_1 and line & won_mask_2):
+                        break
+                else:
+                    # No line can be completed any more, this includes a full main board
+                    winner = 0
+            if decided >> c & 1:
+                allowed = full & ~decided
+            else:
+                allowed = 1 << c
+            player = 3 - player
+            number_of_moves += 1
+        self.drawn_mask = drawn_mask
+        self.allowed_mask = allowed
+        self.current_player = player
+        self.cells_key = cells_key
+        self.winner = winner
+        self.current_move += number_of_moves
+        return winner
+
+    def get_random_cell(self):
+        """ Return a uniformly random legal move as (sub-board index, cell index) """
+        allowed = self.allowed_mask
+        if allowed & (allowed - 1) == 0:
+            s = allowed.bit_length() - 1
+            cells = self.get_empty_cells(s)
+            return s, cells[int(random.random() * len(cells))]
+        sub_board_cells = []
+        number_of_moves = 0
+        while allowed:
+            lowest = allowed & -allowed
+            s = lowest.bit_length() - 1
+            allowed ^= lowest
+            cells = self.get_empty_cells(s)
+            sub_board_cells.append((s, cells))
+            number_of_moves += len(cells)
+        i = int(random.random() * number_of_moves)
+        for s, cells in sub_board_cells:
+            if i < len(cells):
+                return s, cells[i]
+            i -= len(cells)
+
+    # The text rendering of MainBoard only reads cells through get_cell
+    print_board = MainBoard.print_board
+
+    def get_features(self):
+        """ Return the input array of the neural network without copying it, the same as MainBoard.get_features() """
+        if self.features is None:
+            number_of_moves = self.board_size ** 4
+            self.features = np.zeros(3 * number_of_moves + 1, dtype=np.float32)
+            for s in range(self.cells_per_sub_board):
+                for c in range(self.cells_per_sub_board):
+                    for player in (1, 2):
+                        if self.player_masks[player - 1][s] >> c & 1:
+                            self.features[(player - 1) * number_of_moves + s * self.cells_per_sub_board + c] = 1
+            self.update_features_legal_moves(0)
+        return self.features
+
+    def update_features(self, cell_index, player, value, previous_allowed_mask):
+        """ Set the feature of player's cell to value (1 when a move is made, 0 when it is taken back) """
+        self.features[(player - 1) * self.board_size ** 4 + cell_index] = value
+        self.update_features_legal_moves(previous_allowed_mask)
+
+    def update_features_legal_moves(self, previous_allowed_mask):
+        """
+        Update the legal moves and the current player in the features, after the allowed sub-boards were
+        previous_allowed_mask
+
+        The legal moves of the sub-boards that are not allowed are always 0, so only the sub-boards allowed before are
+        cleared and only the sub-boards allowed now are set.
+        """
+        features = self.features
+        cells_per_sub_board = self.cells_per_sub_board
+        number_of_moves = self.board_size ** 4
+        legal_moves_start = 2 * number_of_moves
+        if previous_allowed_mask & (previous_allowed_mask - 1) == 0:
+            if previous_allowed_mask:
+                start = legal_moves_start + (previous_allowed_mask.bit_length() - 1) * cells_per_sub_board
+                features[start:start + cells_per_sub_board] = 0
+        else:
+            # Clearing all the legal moves at once is cheaper than clearing several sub-boards
+            features[legal_moves_start:legal_moves_start + number_of_moves] = 0
+        if self.winner is None:
+            allowed = self.allowed_mask
+            while allowed:
+                lowest = allowed & -allowed
+                s = lowest.bit_length() - 1
+                allowed ^= lowest
+                start = legal_moves_start + s * cells_per_sub_board
+                for c in self.get_empty_cells(s):
+                    features[start + c] = 1
+        features[3 * number_of_moves] = self.current_player - 1
+
+    def to_array(self):
+        size = self.board_size * self.board_size
+        player1_array = []
+        player2_array = []
+        for s in range(size):
+            for c in range(size):
+                player1_array.append(self.player_masks[0][s] >> c & 1)
+                player2_array.append(self.player_masks[1][s] >> c & 1)
+        return player1_array, player2_array
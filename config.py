@@ -1,11 +1,62 @@
 import math
+import os
 
 mute = False
 number_of_games = 1
 board_size = 3
 number_of_simulations = 2000
 time_limit = None
+# Total time in seconds of each mcts and mctss player for a game, split over its moves by a TimeManager, None to search
+# each move with number_of_simulations and time_limit instead
+total_time = None
+# The clock is read every time_check_interval simulations
+time_check_interval = 16
+# Expected number of moves of a game as a fraction of the number of cells, and the fewest moves the remaining time is
+# split over
+expected_game_length = 0.6
+minimum_moves_to_go = 5
+# A move may stop at its target time once its best move is the same for stable_time of the target time. Otherwise it
+# may take time_extension times its target time, but never more than maximum_time_fraction of the remaining time, and
+# time_margin seconds of the remaining time are kept for the overhead
+stable_time = 0.5
+time_extension = 3
+maximum_time_fraction = 0.25
+time_margin = 0.05
+# Stop the search of a move before its budget once the most visited child of the root node is also the best one, and
+# either no other child can catch up in the simulations left or it has early_stop_visit_share of the visits
+early_stop = True
+early_stop_visit_share = 0.9
 exploration_weight = math.sqrt(2)
+# Run the search trees on BitBoard instead of MainBoard
+use_bitboard = False
+# Seed of the Zobrist keys of positions, positions have the same key in every process with the same seed
+zobrist_seed = 0
+# Share the nodes of transposed positions in MCTS and MCTSSolver, and the maximum number of shared nodes
+use_transposition_table = False
+transposition_table_size = 1000000
+# Nodes of the search trees visited at least this many times keep their game state, see Node.game_state
+keep_game_state_visits = 100
+# Store the search trees of mcts, mctss and mcrave players in NumPy arrays instead of Node objects, see array_tree.py
+use_array_tree = False
+# Number of processes searching each move of mcts and mctss players, see parallel_search.py
+workers = 1
+# Number of rollouts from each leaf node selected by mcts and mctss players, and the number of processes running them
+rollouts_per_leaf = 1
+rollout_workers = 1
+# Number of threads sharing the search tree of mcts and mctss players, and the loss added to the path of each running
+# simulation so that the threads spread out, see MCTS.run_tree_parallel()
+threads = 1
+virtual_loss = 1
+# Let mcts and mctss players keep searching during the opponent's turn, up to this many simulations per turn
+ponder = False
+max_ponder_simulations = 100000
+# Node budget of the search trees, by number of nodes or by estimated bytes, None for no limit. A tree at its budget
+# stops creating nodes and keeps backing up the rollouts from its leaves, see MCTS.is_full()
+max_tree_nodes = None
+max_tree_bytes = None
+# Directory of the cached tables of sub-board outcomes, next to this file whatever the working directory, see
+# sub_board_table.py
+table_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
 
 learning_rate = 0.05
 epochs = 2
@@ -5,7 +5,7 @@ import argparse
 import time
 
 from main_board import MainBoard
-from player import RandomPlayer, HumanPlayer, MCTSPlayer, MCRAVEPlayer, HMCRAVEPlayer, MCTSSolverPlayer, MCTSAlphaPlayer
+from player import RandomPlayer, HumanPlayer, MCTSPlayer, MCRAVEPlayer, HMCRAVEPlayer, MCTSSolverPlayer, MCTSAlphaPlayer, ScoreBoundedPlayer
 import config
 from neural_network import NeuralNetwork
 
@@ -15,12 +15,12 @@ def get_parser():
     parser = argparse.ArgumentParser(description="An Untimate Tic Tac Toe Game")
 
     parser.add_argument('player_1',
-                        help="Agent of player 1. (random, human, mcts, mctss, mcrave or hmcrave)",
-                        choices=['random', 'human', 'mcts', 'mctss', 'mctsa', 'mcrave', 'hmcrave'])
+                        help="Agent of player 1. (random, human, mcts, mctss, mctsb, mcrave or hmcrave)",
+                        choices=['random', 'human', 'mcts', 'mctss', 'mctsb', 'mctsa', 'mcrave', 'hmcrave'])
 
     parser.add_argument('player_2',
-                        help="Agent of player 2. (random, human, mcts, mctss, mcrave or hmcrave)",
-                        choices=['random', 'human', 'mcts', 'mctss', 'mctsa', 'mcrave', 'hmcrave'])
+                        help="Agent of player 2. (random, human, mcts, mctss, mctsb, mcrave or hmcrave)",
+                        choices=['random', 'human', 'mcts', 'mctss', 'mctsb', 'mctsa', 'mcrave', 'hmcrave'])
 
     parser.add_argument('-m',
                         '--mute',
@@ -51,33 +51,72 @@ def get_parser():
                         help="Time limit per move.",
                         type=float,
                         default=config.time_limit)
+
+    parser.add_argument('-T',
+                        '--total_time',
+                        help="Total time of each mcts, mctss, mctsb, mcrave and hmcrave player for a game, split over its moves. Replaces the number of simulations and time limit per move.",
+                        type=float,
+                        default=config.total_time)
+
+    parser.add_argument('--bitboard',
+                        help="Run the search of MCTS players on a bitboard.",
+                        action="store_true",
+                        default=config.use_bitboard)
+
+    parser.add_argument('--transposition',
+                        help="Share the nodes of transposed positions in the search of mcts and mctss players.",
+                        action="store_true",
+                        default=config.use_transposition_table)
+
+    parser.add_argument('--array-tree',
+                        help="Store the search tree of mcts, mctss and mcrave players in arrays.",
+                        action="store_true",
+                        default=config.use_array_tree)
+
+    parser.add_argument('-w',
+                        '--workers',
+                        help="Number of processes searching each move of mcts and mctss players, with their results merged.",
+                        type=int,
+                        default=config.workers)
+
+    parser.add_argument('--threads',
+                        help="Number of threads sharing the search tree of mcts and mctss players.",
+                        type=int,
+                        default=config.threads)
+
+    parser.add_argument('--ponder',
+                        help="Let mcts, mctss and mctsb players keep searching during the opponent's turn.",
+                        action="store_true",
+                        default=config.ponder)
     return parser
 
 
-def get_player(main_board, player_type, player_id, number_of_simulations=config.number_of_simulations, time_limit=config.time_limit, net=None):
+def get_player(main_board, player_type, player_id, number_of_simulations=config.number_of_simulations, time_limit=config.time_limit, net=None, use_bitboard=config.use_bitboard, use_transposition_table=config.use_transposition_table, use_array_tree=config.use_array_tree, workers=config.workers, threads=config.threads, ponder=config.ponder, total_time=config.total_time):
     if player_type == 'random':
         return RandomPlayer(main_board)
     if player_type == 'human':
         return HumanPlayer(main_board)
     if player_type == 'mcts':
-        return MCTSPlayer(main_board, player_id, number_of_simulations, time_limit)
+        return MCTSPlayer(main_board, player_id, number_of_simulations, time_limit, use_bitboard=use_bitboard, use_transposition_table=use_transposition_table, use_array_tree=use_array_tree, workers=workers, threads=threads, ponder=ponder, total_time=total_time)
     if player_type == 'mcrave':
-        return MCRAVEPlayer(main_board, player_id, number_of_simulations, time_limit)
+        return MCRAVEPlayer(main_board, player_id, number_of_simulations, time_limit, use_bitboard=use_bitboard, use_array_tree=use_array_tree, total_time=total_time)
     if player_type == 'hmcrave':
-        return HMCRAVEPlayer(main_board, player_id, number_of_simulations, time_limit)
+        return HMCRAVEPlayer(main_board, player_id, number_of_simulations, time_limit, use_bitboard=use_bitboard, total_time=total_time)
     if player_type == 'mctss':
-        return MCTSSolverPlayer(main_board, player_id, number_of_simulations, time_limit)
+        return MCTSSolverPlayer(main_board, player_id, number_of_simulations, time_limit, use_bitboard=use_bitboard, use_transposition_table=use_transposition_table, use_array_tree=use_array_tree, workers=workers, threads=threads, ponder=ponder, total_time=total_time)
+    if player_type == 'mctsb':
+        return ScoreBoundedPlayer(main_board, player_id, number_of_simulations, time_limit, use_bitboard=use_bitboard, ponder=ponder, total_time=total_time)
     if player_type == 'mctsa':
-        return MCTSAlphaPlayer(main_board, player_id, net, num_of_simulation=number_of_simulations, time_limit=time_limit)
+        return MCTSAlphaPlayer(main_board, player_id, net, num_of_simulation=number_of_simulations, time_limit=time_limit, use_bitboard=use_bitboard)
 
-def start_game(player_type_1='random', player_type_2='random', mute=config.mute, board_size=config.board_size, number_of_simulations=config.number_of_simulations, time_limit=config.time_limit, net=None):
+def start_game(player_type_1='random', player_type_2='random', mute=config.mute, board_size=config.board_size, number_of_simulations=config.number_of_simulations, time_limit=config.time_limit, net=None, use_bitboard=config.use_bitboard, use_transposition_table=config.use_transposition_table, use_array_tree=config.use_array_tree, workers=config.workers, threads=config.threads, ponder=config.ponder, total_time=config.total_time):
     if not mute:
         print('***********************')
         print(' Ultimate Tic-Tac-Toe! ')
         print('***********************')
     main_board = MainBoard(board_size)
-    player_1 = get_player(main_board, player_type_1, 1, number_of_simulations, time_limit, net)
-    player_2 = get_player(main_board, player_type_2, 2, number_of_simulations, time_limit, net)
+    player_1 = get_player(main_board, player_type_1, 1, number_of_simulations, time_limit, net, use_bitboard, use_transposition_table, use_array_tree, workers, threads, ponder, total_time)
+    player_2 = get_player(main_board, player_type_2, 2, number_of_simulations, time_limit, net, use_bitboard, use_transposition_table, use_array_tree, workers, threads, ponder, total_time)
     if not mute:
         main_board.print_board()
 
@@ -89,6 +128,8 @@ def start_game(player_type_1='random', player_type_2='random', mute=config.mute,
         #     print(child_node.total_reward)
         while not current_player.make_move(main_board_coor, sub_board_coor):
             main_board_coor, sub_board_coor = current_player.get_move()
+        if not mute and isinstance(current_player, MCTSPlayer):
+            print(current_player.get_search_report())
         current_player = player_1 if current_player == player_2 else player_2
         if not mute:
             main_board.print_board()
@@ -113,6 +154,13 @@ def main():
     board_size = args.board_size
     number_of_simulations = args.number_of_simulations
     time_limit = args.time_limit
+    use_bitboard = args.bitboard
+    use_transposition_table = args.transposition
+    use_array_tree = args.array_tree
+    workers = args.workers
+    threads = args.threads
+    ponder = args.ponder
+    total_time = args.total_time
 
     net = NeuralNetwork()
     # Initialize the network with the best model.
@@ -134,7 +182,7 @@ def main():
     for i in range(number_of_games):
         print("Game " + str(i) + " starts!")
         start_game_time = time.time()
-        result = start_game(player_1, player_2, mute, board_size, number_of_simulations, time_limit, net)
+        result = start_game(player_1, player_2, mute, board_size, number_of_simulations, time_limit, net, use_bitboard, use_transposition_table, use_array_tree, workers, threads, ponder, total_time)
         print("Game Time: ", time.time() - start_game_time)
         if result == 0:
             draw += 1
@@ -148,6 +196,8 @@ def main():
         print("Number of simulations per move: ", number_of_simulations)
     if time_limit:
         print("Time limit per move: ", time_limit)
+    if total_time:
+        print("Total time per player: ", total_time)
     print("Win (Player 1): ", win)
     print("Draw: ", draw)
     print("Loss: ", loss)
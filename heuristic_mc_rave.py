@@ -1,37 +1,39 @@
 from mc_rave import MCRAVE, MCRAVENode
 import math
-from copy import deepcopy
 import random
 import config
 
 class HMCRAVE(MCRAVE):
+    # All the children are created at once, with their game states
+    bytes_per_node = 2100
+
     def __init__(self, root_game_state, player_id):
-        self.root_node = HMCRAVENode(root_game_state, None, None, player_id)
+        self.root_node = HMCRAVENode(root_game_state, None, player_id)
+        self.transposition_table = None
         self.root_node.expand()
         # Player id of the agent, not the current player of each node
         self.player_id = player_id
 
 class HMCRAVENode(MCRAVENode):
-    def __init__(self, game_state, move, parent_node, player_id, mc_value=0, mc_count=0):
-        super().__init__(game_state, move, parent_node, player_id)
+    def __init__(self, game_state, parent_node, player_id, mc_value=0, mc_count=0):
+        super().__init__(game_state, parent_node, player_id)
         self.total_reward = mc_value
         self.visited_times = mc_count
 
     def expand(self):
-        """ Create child nodes """
+        """ Create all child nodes at once with their heuristic values, their game states are rebuilt when needed """
         # print("self move: ", self.move)
-        if not self.child_nodes:
-            legal_moves = self.game_state.get_legal_moves()
-            for move in legal_moves:
+        if self.legal_moves is None:
+            super().expand()
+            for slot, move in enumerate(self.legal_moves):
                 # print("Added move: ", move)
                 mc_count, mc_value, amaf_count, amaf_value = self.heuristic(move)
-                self.action_amaf_count_value_map[move] = (amaf_count, amaf_value)
-                child_game_state = deepcopy(self.game_state)
-                child_game_state.make_move(move[0], move[1])
-                self.child_nodes.append(self.get_new_node(child_game_state, move, self, self.player_id, mc_value=mc_value, mc_count=mc_count))
+                self.amaf_counts[slot] = amaf_count
+                self.amaf_values[slot] = amaf_value
+                self.set_child_node(slot, self.get_new_node(None, self, self.player_id, mc_value=mc_value, mc_count=mc_count))
 
-    def get_new_node(self, game_state, move, parent_node, player_id, mc_value = 0, mc_count = 0):
-        return HMCRAVENode(game_state, move, parent_node, player_id, mc_value=mc_value, mc_count=mc_count)
+    def get_new_node(self, game_state, parent_node, player_id, mc_value = 0, mc_count = 0):
+        return HMCRAVENode(game_state, parent_node, player_id, mc_value=mc_value, mc_count=mc_count)
 
     def heuristic(self, move):
         """
@@ -48,28 +50,26 @@ class HMCRAVENode(MCRAVENode):
         if self.game_state.current_player != self.player_id:
             return 0, 0, 0, 0
 
-        # Make a move
-        game_state_copy = deepcopy(self.game_state)
-        game_state_copy.make_move(move[0], move[1])
-
-        # Check win
-        if game_state_copy.winner is not None and game_state_copy.winner == self.player_id:
-            return 1, math.inf, 1, math.inf
+        # Make a move, it is taken back before returning
+        game_state = self.game_state
+        game_state.push(move)
+        try:
+            # Check win
+            if game_state.winner is not None and game_state.winner == self.player_id:
+                return 1, math.inf, 1, math.inf
 
-        # Check immediate loss
-        legal_moves = game_state_copy.get_legal_moves()
-        for move_2 in legal_moves:
-            game_state_copy_2 = deepcopy(game_state_copy)
-            game_state_copy_2.make_move(move_2[0], move_2[1])
-            if game_state_copy_2.winner is not None and game_state_copy_2.winner != self.player_id:
+            # Check immediate loss, the opponent can end the game with a win or a draw
+            if game_state.can_end_game():
                 return 1, -math.inf, 1, -math.inf
 
-        # Wins sub-board
-        if game_state_copy.sub_board_values[move[0][0]][move[0][1]] == self.player_id:
-            return 1, 1, 1, 10
+            # Wins sub-board
+            if game_state.sub_board_values[move[0][0]][move[0][1]] == self.player_id:
+                return 1, 1, 1, 10
+        finally:
+            game_state.pop()
 
         # # Blocks opponent winner that sub board
-        # game_state_copy_opponent = deepcopy(self.game_state)
+        # game_state_copy_opponent = self.game_state.clone()
         # game_state_copy_opponent.current_player = int(2 / game_state_copy_opponent.current_player)
         # game_state_copy_opponent.make_move(move[0], move[1])
         # if game_state_copy_opponent.sub_board_values[move[0][0]][move[0][1]] == int(2 / self.player_id):
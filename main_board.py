@@ -1,4 +1,9 @@
-from sub_board import SubBoard
+import random
+
+import numpy as np
+
+from sub_board import SubBoard, get_lines_through
+from zobrist import get_zobrist_keys
 import config
 
 class MainBoard:
@@ -12,10 +17,56 @@ class MainBoard:
         self.board_size = board_size
         self.sub_board_values = [[None for column in range(self.board_size)] for row in range(self.board_size)]
         self.sub_boards = [[SubBoard(self.board_size) for column in range(self.board_size)] for row in range(self.board_size)]
-        self.allowed_sub_boards = [(x, y) for x in range(self.board_size) for y in range(self.board_size)]
+        # Sub-boards that are not yet decided
+        self.open_sub_boards = {(x, y) for x in range(self.board_size) for y in range(self.board_size)}
+        self.allowed_sub_boards = set(self.open_sub_boards)
         self.winner = None
         self.current_move = 0
         self.current_player = 1
+        # Number of sub-boards won by each player on every line, so that a move only checks the lines through its sub-board
+        self.lines_through = get_lines_through(self.board_size)
+        self.line_counts = [[0] * (2 * self.board_size + 2), [0] * (2 * self.board_size + 2)]
+        # Number of drawn sub-boards on every line, and the number of lines that neither player can complete any more,
+        # i.e. with a drawn sub-board or sub-boards won by both players. The game is a draw once every line is blocked
+        self.line_draws = [0] * (2 * self.board_size + 2)
+        self.number_of_blocked_lines = 0
+        self.number_of_decided_sub_boards = 0
+        # Zobrist key of the cells and the player to move, updated by every move, see zobrist_key
+        self.zobrist_keys = get_zobrist_keys(self.board_size)
+        self.cells_key = 0
+        # Cache of get_legal_moves(), cleared whenever the game state changes
+        self.legal_moves = None
+        # Input array of the neural network, built by the first get_features() and then updated in place by every move
+        self.features = None
+        # One entry per move made with push(), see pop()
+        self.undo_stack = []
+        # The moves made with make_move(), i.e. the moves of the players, in order
+        self.move_history = []
+
+    def clone(self):
+        """ Return a copy of this game state, much cheaper than deepcopy """
+        main_board = MainBoard.__new__(MainBoard)
+        main_board.board_size = self.board_size
+        main_board.sub_board_values = [row[:] for row in self.sub_board_values]
+        main_board.sub_boards = [[sub_board.clone() for sub_board in row] for row in self.sub_boards]
+        main_board.open_sub_boards = self.open_sub_boards.copy()
+        # allowed_sub_boards and legal_moves are replaced, never changed, when a move is made, so they can be shared
+        main_board.allowed_sub_boards = self.allowed_sub_boards
+        main_board.winner = self.winner
+        main_board.current_move = self.current_move
+        main_board.current_player = self.current_player
+        main_board.lines_through = self.lines_through
+        main_board.line_counts = [self.line_counts[0][:], self.line_counts[1][:]]
+        main_board.line_draws = self.line_draws[:]
+        main_board.number_of_blocked_lines = self.number_of_blocked_lines
+        main_board.number_of_decided_sub_boards = self.number_of_decided_sub_boards
+        main_board.zobrist_keys = self.zobrist_keys
+        main_board.cells_key = self.cells_key
+        main_board.legal_moves = self.legal_moves
+        main_board.features = self.features.copy() if self.features is not None else None
+        main_board.undo_stack = self.undo_stack[:]
+        main_board.move_history = self.move_history[:]
+        return main_board
 
     def make_move(self, main_board_coor, sub_board_coor):
         """ If a move is made successfully, return True, else return False """
@@ -25,37 +76,162 @@ class MainBoard:
         if main_board_coor not in self.allowed_sub_boards:
             print("Invalid Sub-board")
             return False
+        if not self.sub_boards[main_board_coor[0]][main_board_coor[1]].is_valid_move(self.current_player, sub_board_coor):
+            return False
+        self.apply_legal_move(main_board_coor, sub_board_coor)
+        self.move_history.append((main_board_coor, sub_board_coor))
+        return True
+
+    def apply_legal_move(self, main_board_coor, sub_board_coor):
+        """
+        Make a move without any check or output, for the search which only plays moves from get_legal_moves()
+
+        make_move() is the checked version for moves from the players.
+        """
         target_sub_board = self.sub_boards[main_board_coor[0]][main_board_coor[1]]
-        result = target_sub_board.make_move(self.current_player, sub_board_coor)
-        if not result:
-            return result
-        # A successful move is made
+        target_sub_board.apply_legal_move(self.current_player, sub_board_coor)
+        self.cells_key ^= self.zobrist_keys.moves[self.current_player - 1][self.get_cell_index(main_board_coor, sub_board_coor)]
         self.sub_board_values[main_board_coor[0]][main_board_coor[1]] = target_sub_board.winner
+        if target_sub_board.winner is not None:
+            self.open_sub_boards.remove(main_board_coor)
+        previous_allowed_sub_boards = self.allowed_sub_boards
         self.update_allowed_sub_boards(sub_board_coor)
+        self.legal_moves = None
         self.current_move += 1
         # If player is 1, then 2/1 is 2; If player is 2, then 2/2 is 1
         self.current_player = int(2 / self.current_player)
-        winner = self.get_winner()
-        if winner is not None:
-            self.winner = winner
-        return True
+        if target_sub_board.winner is not None:
+            self.update_winner(main_board_coor, target_sub_board.winner)
+        if self.features is not None:
+            self.update_features(main_board_coor, sub_board_coor, int(2 / self.current_player), 1, previous_allowed_sub_boards)
+
+    def update_winner(self, main_board_coor, sub_board_value):
+        """
+        Updates the winner after the sub-board at main_board_coor is decided, only the lines through it are checked
+
+        The game is a draw as soon as no line can be completed by either player, before all sub-boards are decided.
+        """
+        self.number_of_decided_sub_boards += 1
+        for line in self.lines_through[main_board_coor[0]][main_board_coor[1]]:
+            was_blocked = self.is_line_blocked(line)
+            if sub_board_value == 0:
+                self.line_draws[line] += 1
+            else:
+                self.line_counts[sub_board_value - 1][line] += 1
+                if self.line_counts[sub_board_value - 1][line] == self.board_size:
+                    self.winner = sub_board_value
+            if not was_blocked and self.is_line_blocked(line):
+                self.number_of_blocked_lines += 1
+        if self.winner is None and (self.number_of_blocked_lines == len(self.line_draws) or self.number_of_decided_sub_boards == self.board_size * self.board_size):
+            self.winner = 0
+
+    def is_line_blocked(self, line):
+        """ Return True if neither player can complete a line of the main board """
+        return self.line_draws[line] > 0 or (self.line_counts[0][line] > 0 and self.line_counts[1][line] > 0)
+
+    def blocks_all_lines(self, main_board_coor, sub_board_value):
+        """ Return True if deciding the open sub-board at main_board_coor with sub_board_value would block the last lines """
+        number_of_blocked_lines = self.number_of_blocked_lines
+        for line in self.lines_through[main_board_coor[0]][main_board_coor[1]]:
+            if not self.is_line_blocked(line) and (sub_board_value == 0 or self.line_counts[2 - sub_board_value][line] > 0):
+                number_of_blocked_lines += 1
+        return number_of_blocked_lines == len(self.line_draws)
+
+    @property
+    def zobrist_key(self):
+        """
+        The 64-bit Zobrist key of the position, covering the cells, the allowed sub-boards and the player to move
+
+        The same position has the same key in every process, given config.zobrist_seed.
+        """
+        key = self.cells_key
+        for x, y in self.allowed_sub_boards:
+            key ^= self.zobrist_keys.allowed_sub_boards[x * self.board_size + y]
+        return key
+
+    def get_cell_index(self, main_board_coor, sub_board_coor):
+        """ Return the index of a cell in the whole board, which is also the id of the move on it (see utils.MoveTable) """
+        n = self.board_size
+        return ((main_board_coor[0] * n + main_board_coor[1]) * n + sub_board_coor[0]) * n + sub_board_coor[1]
+
+    def push(self, move):
+        """ Make a legal move that can be taken back with pop(), without any check like apply_legal_move() """
+        # Moves replace allowed_sub_boards instead of changing it, so it can be kept without a copy
+        self.undo_stack.append((move, self.allowed_sub_boards, self.winner))
+        self.apply_legal_move(move[0], move[1])
+
+    def pop(self):
+        """ Take back the last move made with push(), and return it """
+        move, allowed_sub_boards, winner = self.undo_stack.pop()
+        main_board_coor, sub_board_coor = move
+        target_sub_board = self.sub_boards[main_board_coor[0]][main_board_coor[1]]
+        if target_sub_board.winner is not None:
+            # The move decided the sub-board
+            self.open_sub_boards.add(main_board_coor)
+            self.number_of_decided_sub_boards -= 1
+            for line in self.lines_through[main_board_coor[0]][main_board_coor[1]]:
+                was_blocked = self.is_line_blocked(line)
+                if target_sub_board.winner == 0:
+                    self.line_draws[line] -= 1
+                else:
+                    self.line_counts[target_sub_board.winner - 1][line] -= 1
+                if was_blocked and not self.is_line_blocked(line):
+                    self.number_of_blocked_lines -= 1
+        target_sub_board.undo_move(sub_board_coor)
+        self.sub_board_values[main_board_coor[0]][main_board_coor[1]] = None
+        previous_allowed_sub_boards = self.allowed_sub_boards
+        self.allowed_sub_boards = allowed_sub_boards
+        self.legal_moves = None
+        self.winner = winner
+        self.current_move -= 1
+        self.current_player = int(2 / self.current_player)
+        self.cells_key ^= self.zobrist_keys.moves[self.current_player - 1][self.get_cell_index(main_board_coor, sub_board_coor)]
+        if self.features is not None:
+            self.update_features(main_board_coor, sub_board_coor, self.current_player, 0, previous_allowed_sub_boards)
+        return move
+
+    def can_end_game(self):
+        """
+        Return True if the player to move has a move that ends the game
+
+        A move ends the game if it wins a sub-board on a line of the main board where the player has all the other
+        sub-boards, or if it decides the last open sub-board or blocks the last line that could be completed. The
+        winning cells come from the sub-board table, so no move is played.
+        """
+        if self.winner is not None:
+            return False
+        player = self.current_player
+        last = len(self.open_sub_boards) == 1
+        for main_board_coor in self.allowed_sub_boards:
+            sub_board = self.sub_boards[main_board_coor[0]][main_board_coor[1]]
+            if sub_board.get_winning_cells(player):
+                if last or self.blocks_all_lines(main_board_coor, player):
+                    return True
+                line_counts = self.line_counts[player - 1]
+                if any(line_counts[line] == self.board_size - 1 for line in self.lines_through[main_board_coor[0]][main_board_coor[1]]):
+                    return True
+            elif len(sub_board.empty_cells) == 1 and (last or self.blocks_all_lines(main_board_coor, 0)):
+                # The only move left on the sub-board fills it
+                return True
+        return False
 
     def update_allowed_sub_boards(self, sub_board_coor):
         """ Updates the allowed_sub_boards for next move """
         if self.sub_board_values[sub_board_coor[0]][sub_board_coor[1]] is None:
-            self.allowed_sub_boards = [sub_board_coor]
+            self.allowed_sub_boards = {sub_board_coor}
         else:
-            self.allowed_sub_boards = []
-            all_sub_boards = [(x, y) for x in range(self.board_size) for y in range(self.board_size)]
-            for sub_board in all_sub_boards:
-                if self.sub_board_values[sub_board[0]][sub_board[1]] is None:
-                    self.allowed_sub_boards.append(sub_board)
+            self.allowed_sub_boards = set(self.open_sub_boards)
         return self.allowed_sub_boards
 
     def get_winner(self):
-        """ Return Winner if game ends (0: draw, 1: player 1, 2: player 2), return None otherwise"""
+        """
+        Return Winner if game ends (0: draw, 1: player 1, 2: player 2), return None otherwise
+
+        This scans the whole main board, make_move() keeps self.winner up to date without calling it.
+        """
         diag_1 = []
         diag_2 = []
+        lines = [diag_1, diag_2]
         for i in range(self.board_size):
             # Row
             if self.sub_board_values[i][0] is not None and self.sub_board_values[i][0] != 0 and self.sub_board_values[i].count(self.sub_board_values[i][0]) == self.board_size:
@@ -66,6 +242,8 @@ class MainBoard:
                 column.append(self.sub_board_values[j][i])
             if column[0] is not None and column[0] != 0 and column.count(column[0]) == self.board_size:
                 return column[0]
+            lines.append(self.sub_board_values[i])
+            lines.append(column)
             # Diagonals
             diag_1.append(self.sub_board_values[i][i])
             diag_2.append(self.sub_board_values[i][self.board_size - 1 - i])
@@ -76,6 +254,10 @@ class MainBoard:
         if diag_2[0] is not None and diag_2[0] != 0 and diag_2.count(diag_2[0]) == self.board_size:
             return diag_2[0]
 
+        # Draw if no line can be completed
+        if all(0 in line or (1 in line and 2 in line) for line in lines):
+            return 0
+
         # Game not yet end
         for i in range(self.board_size):
             for j in range(self.board_size):
@@ -85,14 +267,25 @@ class MainBoard:
         return 0
 
     def get_legal_moves(self):
-        """ Return all legal moves """
-        if self.winner is not None:
-            return []
-        possible_moves = []
-        for main_board_coor in self.allowed_sub_boards:
-            for cell in self.sub_boards[main_board_coor[0]][main_board_coor[1]].get_all_empty_cells():
-                possible_moves.append((main_board_coor, cell))
-        return possible_moves
+        """ Return all legal moves. The list is cached until the next move, so it must not be modified. """
+        if self.legal_moves is None:
+            if self.winner is not None:
+                self.legal_moves = []
+            else:
+                self.legal_moves = [(main_board_coor, cell) for main_board_coor in self.allowed_sub_boards
+                                    for cell in self.sub_boards[main_board_coor[0]][main_board_coor[1]].empty_cells]
+        return self.legal_moves
+
+    def play_random_game(self):
+        """ Play uniformly random legal moves until the game ends and return the winner """
+        while self.winner is None:
+            main_board_coor, sub_board_coor = random.choice(self.get_legal_moves())
+            self.apply_legal_move(main_board_coor, sub_board_coor)
+        return self.winner
+
+    def get_cell(self, main_board_coor, sub_board_coor):
+        """ Return the player occupying a cell, or None if it is empty """
+        return self.sub_boards[main_board_coor[0]][main_board_coor[1]].cells[sub_board_coor[0]][sub_board_coor[1]]
 
     def print_board(self):
         """ Print out the game state """
@@ -107,7 +300,7 @@ class MainBoard:
             for y_sub in range(self.board_size):
                 for x_main in range(self.board_size):
                     for x_sub in range(self.board_size):
-                        value = self.sub_boards[y_main][x_main].cells[y_sub][x_sub]
+                        value = self.get_cell((y_main, x_main), (y_sub, x_sub))
                         print(value if value is not None else '_', end = '')
                         if x_main == self.board_size - 1 and x_sub == self.board_size - 1 and y_sub == self.board_size - 1:
                             print()
@@ -119,6 +312,58 @@ class MainBoard:
                         else:
                             print('|', end='')
 
+    def get_features(self):
+        """
+        Return the input array of the neural network, without copying it
+
+        The array holds player 1's cells, player 2's cells and the legal moves (one entry per move id each, see
+        utils.MoveTable), then current_player - 1. It is updated in place by every later move, so it must be copied to be kept.
+        """
+        if self.features is None:
+            number_of_moves = self.board_size ** 4
+            self.features = np.zeros(3 * number_of_moves + 1, dtype=np.float32)
+            for x_main in range(self.board_size):
+                for y_main in range(self.board_size):
+                    for x_sub in range(self.board_size):
+                        for y_sub in range(self.board_size):
+                            player = self.get_cell((x_main, y_main), (x_sub, y_sub))
+                            if player is not None:
+                                self.features[(player - 1) * number_of_moves + self.get_cell_index((x_main, y_main), (x_sub, y_sub))] = 1
+            self.update_features_legal_moves(set())
+        return self.features
+
+    def update_features(self, main_board_coor, sub_board_coor, player, value, previous_allowed_sub_boards):
+        """ Set the feature of player's cell to value (1 when a move is made, 0 when it is taken back) """
+        self.features[(player - 1) * self.board_size ** 4 + self.get_cell_index(main_board_coor, sub_board_coor)] = value
+        self.update_features_legal_moves(previous_allowed_sub_boards)
+
+    def update_features_legal_moves(self, previous_allowed_sub_boards):
+        """
+        Update the legal moves and the current player in the features, after the allowed sub-boards were
+        previous_allowed_sub_boards
+
+        The legal moves of the sub-boards that are not allowed are always 0, so only the sub-boards allowed before are
+        cleared and only the sub-boards allowed now are set.
+        """
+        features = self.features
+        n = self.board_size
+        cells_per_sub_board = n * n
+        number_of_moves = n ** 4
+        legal_moves_start = 2 * number_of_moves
+        if len(previous_allowed_sub_boards) == 1:
+            for x, y in previous_allowed_sub_boards:
+                start = legal_moves_start + (x * n + y) * cells_per_sub_board
+                features[start:start + cells_per_sub_board] = 0
+        elif previous_allowed_sub_boards:
+            # Clearing all the legal moves at once is cheaper than clearing several sub-boards
+            features[legal_moves_start:legal_moves_start + number_of_moves] = 0
+        if self.winner is None:
+            for x, y in self.allowed_sub_boards:
+                start = legal_moves_start + (x * n + y) * cells_per_sub_board
+                for i, j in self.sub_boards[x][y].empty_cells:
+                    features[start + i * n + j] = 1
+        features[3 * number_of_moves] = self.current_player - 1
+
     def to_array(self):
         array = []
         all_sub_boards = [(x, y) for x in range(self.board_size) for y in range(self.board_size)]
@@ -1,13 +1,16 @@
 from monte_carlo_tree_search import MCTS, Node
 import math
-from copy import deepcopy
 import random
 import config
+import utils
 
 
 class MCRAVE(MCTS):
+    bytes_per_node = 900
+
     def __init__(self, root_game_state, player_id):
-        self.root_node = MCRAVENode(root_game_state, None, None, player_id)
+        self.root_node = MCRAVENode(root_game_state, None, player_id)
+        self.transposition_table = None
         self.root_node.expand()
         # Player id of the agent, not the current player of each node
         self.player_id = player_id
@@ -29,58 +32,87 @@ class MCRAVE(MCTS):
                     max_reward = reward
                     best_node = node
         if best_node is None:
-            return self.root_node.child_nodes[0]
+            # No simulation ran, e.g. the time of the move was already spent, so the child nodes may not exist yet
+            return self.root_node.get_next_child_node()
         return best_node
 
     def simulation(self):
         """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
         target_node = self.selection()
-        if target_node.visited_times != 0 and target_node.game_state.winner is None:
+        if target_node.visited_times != 0 and target_node.game_state.winner is None and not self.is_full():
             target_node.expand()
-            target_node = target_node.child_nodes[0]
-        reward, action_sequence = target_node.rollout()
-        if target_node.game_state.current_player == self.player_id:
-            target_node.back_propagation(-reward, action_sequence)
+            target_node = target_node.get_next_child_node()
+        # The rollout may take the game state of the node
+        current_player = target_node.game_state.current_player
+        reward, played_moves = target_node.rollout()
+        if current_player == self.player_id:
+            target_node.back_propagation(-reward, played_moves)
         else:
-            target_node.back_propagation(reward, action_sequence)
+            target_node.back_propagation(reward, played_moves)
 
 
 class MCRAVENode(Node):
-    def __init__(self, game_state, move, parent_node, player_id):
-        super().__init__(game_state, move, parent_node, player_id)
-        # Map of tuples: { action: (amaf_count, amaf_value) }
-        self.action_amaf_count_value_map = {}
+    def __init__(self, game_state, parent_node, player_id):
+        super().__init__(game_state, parent_node, player_id)
+        # AMAF statistics of the legal moves in the order of legal_moves
+        self.amaf_counts = None
+        self.amaf_values = None
+        # The bit mask of the ids of the legal moves (see utils.MoveTable), and the index in legal_moves of each bit
+        self.legal_move_mask = 0
+        self.bit_slots = {}
 
     def rollout(self):
         """ 
         Plays a full game from self.game_state with random actions 
 
         Return the reward. (1 if this agent wins, 0 is draw, -1 if this agent losses)
-        Return all the performed actions.
+        Return the bit mask of the ids of the moves made by this agent.
         """
-        action_sequence = []
-        game_state_copy = deepcopy(self.game_state)
+        played_moves = 0
+        game_state_copy = self.take_game_state()
+        move_ids = utils.get_move_table(game_state_copy.board_size).ids
         while game_state_copy.winner is None:
             # Get current_player before move is make
             current_player = game_state_copy.current_player
             legal_moves = game_state_copy.get_legal_moves()
-            main_board_coor, sub_board_coor = random.choice(legal_moves)
-            game_state_copy.make_move(main_board_coor, sub_board_coor)
-            # Only append actions made by this AI
+            move = random.choice(legal_moves)
+            game_state_copy.apply_legal_move(move[0], move[1])
+            # Only record actions made by this AI
             if current_player == self.player_id:
-                action_sequence.append((main_board_coor, sub_board_coor))
+                played_moves |= 1 << move_ids[move]
         if game_state_copy.winner == self.player_id:
             # This agent wins
-            return 1, action_sequence
+            return 1, played_moves
         elif game_state_copy.winner == 0:
-            return 0, action_sequence
+            return 0, played_moves
         else:
-            return -1, action_sequence
+            return -1, played_moves
+
+    def select_slot(self):
+        """ Return the index in legal_moves of the child with the best modified UCB1, see Node.select_slot() """
+        log_visited_times = math.log(max(self.visited_times, 1))
+        best_slot = 0
+        max_UCB1 = -math.inf
+        for slot, (visited_times, total_reward, amaf_count, amaf_value) in enumerate(zip(self.child_visits, self.child_rewards, self.amaf_counts, self.amaf_values)):
+            if visited_times == 0:
+                return slot
+            if amaf_count == 0:
+                UCB1 = total_reward / visited_times + config.exploration_weight * math.sqrt(log_visited_times / visited_times)
+            else:
+                beta = amaf_count / (visited_times + amaf_count + 4 * visited_times * amaf_count * 0.2)
+                UCB1 = (1 - beta) * (total_reward / visited_times) + beta * (amaf_value / amaf_count) + \
+                    config.exploration_weight * math.sqrt(log_visited_times / visited_times)
+            if UCB1 > max_UCB1:
+                if UCB1 == math.inf:
+                    return slot
+                best_slot = slot
+                max_UCB1 = UCB1
+        return best_slot
 
     def compute_UCB1(self):
         """ Compute the modified UCB1 value """
-        amaf_count = self.parent_node.action_amaf_count_value_map[self.move][0]
-        amaf_value = self.parent_node.action_amaf_count_value_map[self.move][1]
+        amaf_count = self.parent_node.amaf_counts[self.slot]
+        amaf_value = self.parent_node.amaf_values[self.slot]
 
         if self.visited_times == 0:
             # UCB1 = amaf_value / amaf_count
@@ -95,34 +127,38 @@ class MCRAVENode(Node):
 
         return UCB1
 
-    def back_propagation(self, reward, action_sequence):
-        """ Update the visited_times and total_reward of the current node, and also its parent node, until the root node is reached """
-        self.visited_times += 1
-        self.total_reward += reward
-        for action in action_sequence:
-            # All legal moves of a node are initiated with 0 amaf count and value, we can ignore the action here if
-            # it if not in self.action_amaf_count_value_map. Because only direct child moves are affected by the
-            # amaf values in this algorithm.
-            if action in self.action_amaf_count_value_map:
-                new_amaf_count = self.action_amaf_count_value_map[action][0] + 1
-                new_amaf_value = self.action_amaf_count_value_map[action][1] + reward
-                self.action_amaf_count_value_map[action] = (new_amaf_count, new_amaf_value)
-            # As mentioned above, this can be ignored
-            # else:
-            #     self.action_amaf_count_value_map[action] = (1, reward)
-        if self.parent_node is not None:
-            self.parent_node.back_propagation(-reward, action_sequence)
+    def back_propagation(self, reward, played_moves):
+        """
+        Update the visited_times and total_reward of the current node, and also its parent node, until the root node is reached
+
+        The AMAF statistics of the legal moves in played_moves, a bit mask of move ids, are updated on the way. Only the
+        legal moves of a node have AMAF statistics, because only direct child moves are affected by the amaf values in
+        this algorithm, so each node only visits the bits of its legal moves that are also in played_moves.
+        """
+        node = self
+        while node is not None:
+            node.visited_times += 1
+            node.total_reward += reward
+            node.update_parent_arrays()
+            bits = node.legal_move_mask & played_moves
+            while bits:
+                bit = bits & -bits
+                bits ^= bit
+                slot = node.bit_slots[bit]
+                node.amaf_counts[slot] += 1
+                node.amaf_values[slot] += reward
+            reward = -reward
+            node = node.parent_node
 
     def expand(self):
-        """ Create child nodes """
-        if not self.child_nodes:
-            legal_moves = self.game_state.get_legal_moves()
-            for move in legal_moves:
-                child_game_state = deepcopy(self.game_state)
-                child_game_state.make_move(move[0], move[1])
-                self.child_nodes.append(self.get_new_node(child_game_state, move, self, self.player_id))
-                # To make sure move is in action_amaf_count_value_map
-                self.action_amaf_count_value_map[move] = (0, 0)
-
-    def get_new_node(self, game_state, move, parent_node, player_id):
-        return MCRAVENode(game_state, move, parent_node, player_id)
+        """ Record the legal moves, their child nodes are created when selection first takes them """
+        if self.legal_moves is None:
+            super().expand()
+            self.amaf_counts = [0] * len(self.legal_moves)
+            self.amaf_values = [0] * len(self.legal_moves)
+            move_ids = utils.get_move_table(self.game_state.board_size).ids
+            self.bit_slots = {1 << move_ids[move]: slot for slot, move in enumerate(self.legal_moves)}
+            self.legal_move_mask = sum(self.bit_slots)
+
+    def get_new_node(self, game_state, parent_node, player_id):
+        return MCRAVENode(game_state, parent_node, player_id)
@@ -9,7 +9,11 @@ import utils
 
 class MCTSAlpha(MCTSSolver):
     def __init__(self, root_game_state, player_id, net):
-        self.root_node = MCTSAlphaNode(root_game_state, None, None, player_id, net)
+        # The game states of the other nodes are cloned from the root's, so they copy its features and update them
+        # move by move instead of building them again
+        root_game_state.get_features()
+        self.root_node = MCTSAlphaNode(root_game_state, None, player_id, net)
+        self.transposition_table = None
         # self.root_node.expand()
         # Player id of the agent, not the current player of each node
         self.player_id = player_id
@@ -17,34 +21,25 @@ class MCTSAlpha(MCTSSolver):
 
     def get_prob(self):
         """ Return the probability of selection for child nodes of root nodes """
-        action_prob = np.zeros(81)
-        for i in range(81):
-            move = utils.index_to_move(i)
-            if move not in self.root_node.game_state.get_legal_moves():
-                action_prob[i] = 0
-            else:
-                for child in self.root_node.child_nodes:
-                    if child.move == move:
-                        action_prob[i] = child.visited_times / self.root_node.visited_times
+        move_table = utils.get_move_table(self.root_node.game_state.board_size)
+        action_prob = np.zeros(move_table.number_of_moves)
+        for child in self.root_node.child_nodes:
+            action_prob[move_table.ids[child.move]] = child.visited_times / self.root_node.visited_times
         return action_prob
 
     def get_avg_reward(self):
         """ Return the probability of selection for child nodes of root nodes """
-        avg_reward = np.zeros(81)
-        for i in range(81):
-            move = utils.index_to_move(i)
-            if move not in self.root_node.game_state.get_legal_moves():
-                avg_reward[i] = -1
+        move_table = utils.get_move_table(self.root_node.game_state.board_size)
+        # Illegal moves have a reward of -1
+        avg_reward = np.full(move_table.number_of_moves, -1.0)
+        for child in self.root_node.child_nodes:
+            if child.visited_times == 0:
+                avg_reward[move_table.ids[child.move]] = child.total_reward
             else:
-                for child in self.root_node.child_nodes:
-                    if child.move == move:
-                        if child.visited_times == 0:
-                            avg_reward[i] = child.total_reward
-                        else:
-                            avg_reward[i] = child.total_reward / child.visited_times
+                avg_reward[move_table.ids[child.move]] = child.total_reward / child.visited_times
         # Normalize avg_reward
-        # avg_reward.ptp(0) returns avg_reward.max(0) - avg_reward.min(0), 0 is the axis
-        avg_reward_norm = (avg_reward - avg_reward.min(0)) / avg_reward.ptp(0)
+        # np.ptp(avg_reward, 0) returns avg_reward.max(0) - avg_reward.min(0), 0 is the axis
+        avg_reward_norm = (avg_reward - avg_reward.min(0)) / np.ptp(avg_reward, 0)
         avg_reward_norm = avg_reward_norm / avg_reward_norm.sum(0)
         return avg_reward_norm
 
@@ -89,10 +84,12 @@ class MCTSAlpha(MCTSSolver):
         """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
         start_time = time.time()
         target_node = self.selection()
-        target_node.expand()
+        if not self.is_full():
+            target_node.expand()
+        # A leaf is selected again once the tree is full, then its predicted value is backed up again
+        action_value = 0
         if target_node.predicted_value is None and target_node.game_state.winner is None:
             target_node.set_action_prob_and_predicted_value()
-            action_value = 0
         elif target_node.game_state.winner is not None:
             # Use actual value instead of predicted value (it must be 1 because it is a winning move)
             target_node.predicted_value = 0
@@ -108,14 +105,30 @@ class MCTSAlpha(MCTSSolver):
         # print("Whole simulation: ",time.time() - start_time)
 
 class MCTSAlphaNode(MCTSSolverNode):
-    def __init__(self, game_state, move, parent_node, player_id, net, total_reward=0, visited_times=0):
+    def __init__(self, game_state, parent_node, player_id, net, total_reward=0, visited_times=0):
         a = time.time()
-        super().__init__(game_state, move, parent_node, player_id, total_reward=total_reward, visited_times=visited_times)
+        super().__init__(game_state, parent_node, player_id, total_reward=total_reward, visited_times=visited_times)
         self.net = net
         self.prob = 0
+        # The prob of the children in the order of legal_moves
+        self.child_priors = None
         self.predicted_value = None
         # print("Init Node: ", time.time() - a)
 
+    def select_slot(self):
+        """ Return the index in legal_moves of the child with the best UCB1, see Node.select_slot() """
+        exploration = config.exploration_weight * math.sqrt(self.visited_times)
+        best_slot = 0
+        max_UCB1 = -math.inf
+        for slot, (visited_times, total_reward, prob) in enumerate(zip(self.child_visits, self.child_rewards, self.child_priors)):
+            UCB1 = (total_reward / (1 + visited_times)) + exploration / (1 + visited_times) * prob
+            if UCB1 > max_UCB1:
+                if UCB1 == math.inf:
+                    return slot
+                best_slot = slot
+                max_UCB1 = UCB1
+        return best_slot
+
     def compute_UCB1(self):
         """ Compute the UCB1 value """
         UCB1 = (self.total_reward / (1 + self.visited_times)) + config.exploration_weight * \
@@ -127,34 +140,36 @@ class MCTSAlphaNode(MCTSSolverNode):
         Return the search probability of child nodes and the predicted value of the root node (or all the child?)
         i.e. child_node.visited_times ^ (1/temperature_constant)
         """
-        player1_array, player2_array = self.game_state.to_array()
-        legal_moves = self.game_state.get_legal_moves()
-        legal_moves_array = []
-        for i in range(81):
-            if utils.index_to_move(i) in legal_moves:
-                legal_moves_array.append(1)
-            else:
-                legal_moves_array.append(0)
-        input_array = np.array(player1_array + player2_array + legal_moves_array + [self.game_state.current_player - 1])
+        move_table = utils.get_move_table(self.game_state.board_size)
+        input_array = self.game_state.get_features()
+        # The third block of the features is the legal moves mask
+        legal_move_ids = np.flatnonzero(input_array[2 * move_table.number_of_moves:3 * move_table.number_of_moves])
         action_prob, predicted_value = self.net.predict(input_array)
 
         self.predicted_value = np.array(predicted_value).tolist()[0][0]
 
         # Softmax the probabilities for legal actions
-        legal_action_probs = ([], [])  # ([actions], [probs])
-        for i in range(81):
-            if utils.index_to_move(i) in legal_moves:
-                legal_action_probs[0].append(utils.index_to_move(i))
-                legal_action_probs[1].append(action_prob[i])
-
-        if len(legal_action_probs[0]) > 0:
-            legal_action_probs = (legal_action_probs[0], utils.softmax(np.array(legal_action_probs[1])))
+        legal_action_probs = np.zeros(move_table.number_of_moves)
+        if len(legal_move_ids) > 0:
+            legal_action_probs[legal_move_ids] = utils.softmax(action_prob[legal_move_ids])
 
+        if self.legal_moves:
+            self.child_priors = legal_action_probs[move_table.get_ids(self.legal_moves)].tolist()
         for child_node in self.child_nodes:
-            for index, move in enumerate(legal_action_probs[0]):
-                if child_node.move == move:
-                    child_node.prob = legal_action_probs[1][index]
+            child_node.prob = self.child_priors[child_node.slot]
             # print(child_node.move, child_node.prob)
 
-    def get_new_node(self, game_state, move, parent_node, player_id, total_reward=0, visited_times=0):
-        return MCTSAlphaNode(game_state, move, parent_node, player_id, self.net, total_reward=total_reward, visited_times=visited_times)
+    def expand(self):
+        """ Create all child nodes at once, as PUCT needs the prior of every child. Their game states are rebuilt when needed """
+        if self.legal_moves is None:
+            super().expand()
+            self.child_priors = [0] * len(self.legal_moves)
+            game_state = self.game_state
+            for slot, move in enumerate(self.legal_moves):
+                game_state.push(move)
+                total_reward, visited_times = self.get_initial_stats(game_state)
+                game_state.pop()
+                self.set_child_node(slot, MCTSAlphaNode(None, self, self.player_id, self.net, total_reward=total_reward, visited_times=visited_times))
+
+    def get_new_node(self, game_state, parent_node, player_id):
+        return MCTSAlphaNode(game_state, parent_node, player_id, self.net, *self.get_initial_stats(game_state))
@@ -1,6 +1,5 @@
 from monte_carlo_tree_search import MCTS, Node
 import math
-from copy import deepcopy
 import random
 import config
 import time
@@ -10,78 +9,132 @@ class MCTSSolver(MCTS):
     The total reward of a node becomes +math.inf if it is a proven win for this agent
     The total reward of a node becomes -math.inf if it is a proven loss for this agent
     """
-    def __init__(self, root_game_state, player_id):
-        self.root_node = MCTSSolverNode(root_game_state, None, None, player_id)
+    def __init__(self, root_game_state, player_id, transposition_table=None, rollouts_per_leaf=config.rollouts_per_leaf, rollout_workers=config.rollout_workers):
+        self.root_node = MCTSSolverNode(root_game_state, None, player_id)
+        self.transposition_table = transposition_table
+        self.root_node.transposition_table = transposition_table
         self.root_node.expand()
         # Player id of the agent, not the current player of each node
         self.player_id = player_id
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_workers = rollout_workers
     
+    def get_root_score(self):
+        """ Return the proven score of the root node for the player to move, 1 if a child node is proven to win, -1 if all are proven to lose, None otherwise """
+        if self.get_proven_win_node() is not None:
+            return 1
+        if self.root_node.total_reward == math.inf:
+            return -1
+        return None
+
+    def is_solved(self):
+        return self.get_root_score() is not None
+
     def simulation(self):
         """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
         target_node = self.selection()
 
-        if target_node.visited_times != 0 and target_node.game_state.winner is None:
+        if target_node.visited_times != 0 and target_node.game_state.winner is None and not self.is_full():
             target_node.expand()
-            target_node = target_node.child_nodes[0]
+            target_node = target_node.get_next_child_node()
 
         if target_node.total_reward != math.inf and target_node.total_reward != -math.inf:
-            reward = target_node.rollout()
-            target_node.back_propagation(reward)
+            reward, visits = self.rollout_leaf(target_node)
+            target_node.back_propagation(reward, visits)
         else:
             reward = target_node.total_reward
             target_node.back_propagation(reward)
         # print("Whole Simulation: ", time.time() - start_time)
 
 class MCTSSolverNode(Node):
-    def __init__(self, game_state, move, parent_node, player_id, total_reward = 0, visited_times = 0):
+    def __init__(self, game_state, parent_node, player_id, total_reward = 0, visited_times = 0):
         a = time.time()
-        super().__init__(game_state, move, parent_node, player_id)
+        super().__init__(game_state, parent_node, player_id)
         self.total_reward = total_reward
         self.visited_times = visited_times
+        # The number of child nodes proven to lose (total_reward -math.inf), so that a loss is proven without a scan of
+        # the child nodes. A child proven to win is kept in proven_child
+        self.number_of_lost_children = 0
 
-    def back_propagation(self, reward):
-        if reward == math.inf:
-            # To prove a loss, we need to prove that all children are loss
-            for child_node in self.child_nodes:
-                if child_node.total_reward != -math.inf:
-                    self.total_reward += -1
-                    self.visited_times += 1
-                    if self.parent_node is not None:
-                        self.parent_node.back_propagation(-1)
-                    return
-            self.total_reward = reward
-            self.visited_times += 1
-            if self.parent_node is not None:
-                self.parent_node.back_propagation(-reward)
+    def select_slot(self):
+        """
+        Return the index in legal_moves of the child with the best UCB1, see Node.select_slot()
 
-        elif reward == -math.inf:
-            # To prove a win, we only need one child to be a win
-            self.total_reward = reward
-            self.visited_times += 1
-            if self.parent_node is not None:
-                self.parent_node.back_propagation(-reward)
-            
-        else:
-            self.visited_times += 1
-            self.total_reward += reward
-            if self.parent_node is not None:
-                self.parent_node.back_propagation(-reward)
-    
-    def expand(self):
-        """ Create child nodes """
-        if not self.child_nodes:
-            legal_moves = self.game_state.get_legal_moves()
-            for move in legal_moves:
-                child_game_state = deepcopy(self.game_state)
-                child_game_state.make_move(move[0], move[1])
-                if child_game_state.winner is not None and child_game_state.winner != 0:
-                    total_reward = math.inf
-                    visited_times = 1
-                    # print("Terminal Node Reached in Search Tree:", child_game_state.winner)
+        A child proven to win is taken at once, so that the proof is backed up to this node, and the children proven to
+        lose are skipped without computing their UCB1.
+        """
+        if self.proven_child is not None:
+            return self.proven_child.slot
+        log_visited_times = math.log(max(self.visited_times, 1))
+        best_slot = None
+        max_UCB1 = -math.inf
+        for slot, (visited_times, total_reward) in enumerate(zip(self.child_visits, self.child_rewards)):
+            if visited_times == 0:
+                return slot
+            if total_reward == -math.inf:
+                continue
+            UCB1 = total_reward / visited_times + config.exploration_weight * math.sqrt(log_visited_times / visited_times)
+            if UCB1 > max_UCB1:
+                best_slot = slot
+                max_UCB1 = UCB1
+        if best_slot is None:
+            # Every child is proven to lose
+            return 0
+        return best_slot
+
+    def has_unproven_loss(self):
+        """
+        Return True if some legal move is not proven to lose, i.e. this node is not proven to win
+
+        With a transposition table, a shared child may have been proven through another parent node, so the child nodes
+        are scanned before this returns True.
+        """
+        if not self.legal_moves or self.number_of_lost_children == len(self.legal_moves):
+            return False
+        if self.transposition_table is None or self.has_untried_moves():
+            return True
+        return any(child_node.total_reward != -math.inf for child_node in self.child_nodes)
+
+    def back_propagation(self, reward, visits=1):
+        """ Update the nodes up to the root node like Node.back_propagation(), proving wins and losses on the way """
+        node = self
+        while node is not None:
+            node.visited_times += visits
+            if reward == math.inf:
+                # To prove a loss, we need to prove that all children are loss, untried moves are not proven yet
+                if node.has_unproven_loss():
+                    node.total_reward += -1
+                    # The parent node is also given -1
+                    reward = 1
                 else:
-                    total_reward = 0
-                    visited_times = 0
-                self.child_nodes.append(self.get_new_node(child_game_state, move, self, self.player_id, total_reward, visited_times))
+                    node.total_reward = reward
+                    if node.parent_node is not None:
+                        node.parent_node.proven_child = node
+            elif reward == -math.inf:
+                # To prove a win, we only need one child to be a win
+                if node.total_reward != -math.inf and node.parent_node is not None:
+                    node.parent_node.number_of_lost_children += 1
+                node.total_reward = reward
+            else:
+                node.total_reward += reward
+            node.update_parent_arrays()
+            reward = -reward
+            node = node.parent_node
+    
+    def set_child_node(self, slot, child_node):
+        """ Make child_node the child node of legal_moves[slot], and record it if it is proven """
+        super().set_child_node(slot, child_node)
+        if child_node.total_reward == math.inf:
+            self.proven_child = child_node
+        elif child_node.total_reward == -math.inf:
+            self.number_of_lost_children += 1
+
+    def get_initial_stats(self, game_state):
+        """ Return the total_reward and visited_times of a new child node with game_state, a winning move is a proven win """
+        if game_state.winner is not None and game_state.winner != 0:
+            # print("Terminal Node Reached in Search Tree:", game_state.winner)
+            return math.inf, 1
+        return 0, 0
 
-    def get_new_node(self, game_state, move, parent_node, player_id, total_reward, visited_times):
-        return MCTSSolverNode(game_state, move, parent_node, player_id, total_reward, visited_times)
+    def get_new_node(self, game_state, parent_node, player_id):
+        return MCTSSolverNode(game_state, parent_node, player_id, *self.get_initial_stats(game_state))
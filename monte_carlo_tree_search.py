@@ -1,26 +1,50 @@
-from copy import deepcopy
 import math
-import random
+import threading
+import time
 
 from main_board import MainBoard
+import parallel_search
 import config
+import utils
 
 class MCTS:
     """
     Represents the Monte Carlo Search Tree
     """
-    def __init__(self, root_game_state, player_id):
-        self.root_node = Node(root_game_state, None, None, player_id)
+    # Estimated memory of a node with its share of the kept game states, measured on MainBoard with benchmark.py tree
+    # (less on BitBoard), see get_nbytes()
+    bytes_per_node = 580
+    # Visits added to the path of each simulation, set by trees that score a leaf node with several rollouts
+    rollouts_per_leaf = 1
+
+    def __init__(self, root_game_state, player_id, transposition_table=None, rollouts_per_leaf=config.rollouts_per_leaf, rollout_workers=config.rollout_workers):
+        self.root_node = Node(root_game_state, None, player_id)
+        # Share the nodes of transposed positions, see TranspositionTable
+        self.transposition_table = transposition_table
+        self.root_node.transposition_table = transposition_table
         self.root_node.expand()
         # Player id of the agent, not the current player of each node
         self.player_id = player_id
+        # Number of rollouts from each selected leaf node, and the number of processes running them, see rollout_leaf()
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_workers = rollout_workers
+
+    @property
+    def root_node(self):
+        return self._root_node
+
+    @root_node.setter
+    def root_node(self, node):
+        # The root node has no parent to rebuild its game state from, so it keeps it
+        node.keep_game_state()
+        self._root_node = node
 
     def selection(self):
         """
         Return the leave node with the best UCB1 along the path
         """
         node = self.root_node
-        while node.child_nodes:
+        while node.legal_moves:
             # best_node = None
             # max_UCB1 = None
             # for child_node in node.child_nodes:
@@ -33,9 +57,93 @@ class MCTS:
             #             max_UCB1 = ucb1
             #             best_node = child_node
             # node = best_node
-            node = max(node.child_nodes, key=lambda node: node.compute_UCB1())
+            if self.transposition_table is not None:
+                slot = node.select_shared_slot()
+            else:
+                slot = node.select_slot()
+            if node.children[slot] is not None:
+                child_node = node.children[slot]
+                if self.transposition_table is not None:
+                    # A shared node has several parents, point it to the one it is reached from this time, so that its
+                    # move and back propagation use this path
+                    child_node.parent_node = node
+                    child_node.slot = slot
+                node = child_node
+            elif self.is_full():
+                # No more nodes are created, the rollout starts from this node
+                return node
+            else:
+                node = node.create_child_node(slot)
         return node
 
+    def is_full(self):
+        """ Return True if the tree has reached its node budget (see utils.get_node_budget()), then no nodes are created """
+        node_budget = utils.get_node_budget(self.bytes_per_node)
+        return node_budget is not None and self.get_number_of_nodes() >= node_budget
+
+    def get_number_of_nodes(self):
+        """ Return the number of nodes in the tree, counted as they are created and released """
+        return self.root_node.tree_size[0]
+
+    def get_nbytes(self):
+        """ Return the estimated memory used by the nodes of the tree """
+        return self.get_number_of_nodes() * self.bytes_per_node
+
+    def move_root(self, node):
+        """
+        Make node, a node in the subtree of the root node, the root node, and return the number of nodes released
+
+        The nodes outside of the subtree of node are released (see Node.release()), so that their memory is freed at
+        once and the node budget is left to the new subtree. With a transposition table, the nodes shared with the
+        subtree of node are kept, and the released nodes are removed from the table.
+        """
+        old_root_node = self.root_node
+        # The game state is rebuilt from the old root node before the node is detached from it
+        self.root_node = node
+        node.parent_node = None
+        kept = {id(node)}
+        if self.transposition_table is not None:
+            stack = [node]
+            while stack:
+                parent_node = stack.pop()
+                if not parent_node.is_expanded():
+                    continue
+                for slot, child_node in enumerate(parent_node.children):
+                    if child_node is not None and id(child_node) not in kept:
+                        # The parent node of a shared node may be released
+                        child_node.parent_node = parent_node
+                        child_node.slot = slot
+                        kept.add(id(child_node))
+                        stack.append(child_node)
+            self.transposition_table.retain(kept)
+        released = 0
+        stack = [old_root_node]
+        while stack:
+            released_node = stack.pop()
+            if id(released_node) in kept:
+                continue
+            kept.add(id(released_node))
+            stack.extend(released_node.child_nodes)
+            released_node.release()
+            released += 1
+        node.tree_size[0] -= released
+        return released
+
+    def count_nodes(self):
+        """ Return the number of distinct nodes reachable from the root node """
+        seen = {id(self.root_node)}
+        stack = [self.root_node]
+        while stack:
+            for child_node in stack.pop().child_nodes:
+                if id(child_node) not in seen:
+                    seen.add(id(child_node))
+                    stack.append(child_node)
+        return len(seen)
+
+    def get_proven_win_node(self):
+        """ Return a child node of the root node that is proven to win, or None. Only MCTSSolver proves wins """
+        return self.root_node.proven_child
+
     def get_best_node(self):
         """ Get the best child node of root node. Used for making the real move. """
         best_node = None
@@ -51,30 +159,209 @@ class MCTS:
                         max_reward = reward
                         best_node = node
         if best_node is None:
-            return self.root_node.child_nodes[0]
+            # No simulation ran, e.g. the time of the move was already spent, so the child nodes may not exist yet
+            return self.root_node.get_next_child_node()
         return best_node
 
     def simulation(self):
         """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
         target_node = self.selection()
-        if target_node.visited_times != 0 and target_node.game_state.winner is None:
+        if target_node.visited_times != 0 and target_node.game_state.winner is None and not self.is_full():
             target_node.expand()
-            target_node = target_node.child_nodes[0]
-        reward = target_node.rollout()
-        target_node.back_propagation(reward)
+            target_node = target_node.get_next_child_node()
+        reward, visits = self.rollout_leaf(target_node)
+        target_node.back_propagation(reward, visits)
+
+    def rollout_leaf(self, node):
+        """
+        Return the summed reward of self.rollouts_per_leaf rollouts from a leaf node and the number of rollouts
+
+        With more than one rollout, they run in self.rollout_workers processes (see parallel_search.py), and the result
+        is backed up once with that many visits.
+        """
+        if self.rollouts_per_leaf == 1:
+            return node.rollout(), 1
+        current_player = node.game_state.current_player
+        winners = parallel_search.play_out_in_parallel(self.rollout_workers, node.take_game_state(), self.rollouts_per_leaf)
+        # The same rewards as Node.rollout()
+        reward = sum(-1 if winner == current_player else 0 if winner == 0 else 1 for winner in winners)
+        return reward, len(winners)
+
+    def run_tree_parallel(self, threads, number_of_simulations, time_limit=None, stop_when_proven=False):
+        """
+        Tree parallelisation: run number_of_simulations simulations in threads that share this tree, return the number run
+
+        Selection, expansion and back propagation hold one lock, the rollouts run outside of it, so they overlap on a
+        free-threaded Python build and take turns under the GIL. A virtual loss on the path of every running simulation
+        (see add_virtual_loss()) makes the other threads select other paths meanwhile. With stop_when_proven, the
+        simulations stop once a child node of the root node is a proven win.
+        """
+        lock = threading.Lock()
+        start_time = time.time()
+        # The number of simulations started so far, shared by the threads
+        started = [0]
+
+        def run_simulations():
+            while True:
+                with lock:
+                    if started[0] >= number_of_simulations or (time_limit is not None and time.time() - start_time >= time_limit):
+                        return
+                    if stop_when_proven and self.get_proven_win_node() is not None:
+                        return
+                    started[0] += 1
+                    path = self.select_path()
+                    # The slot of each node in its parent node on this path, another thread may move a shared node
+                    slots = [node.slot for node in path]
+                    self.add_virtual_loss(path, 1)
+                    target_node = path[0]
+                    if target_node.total_reward == math.inf or target_node.total_reward == -math.inf:
+                        # A proven node of MCTSSolver is not rolled out
+                        game_state = None
+                    else:
+                        current_player = target_node.game_state.current_player
+                        game_state = target_node.take_game_state()
+                if game_state is None:
+                    reward, visits = target_node.total_reward, 1
+                else:
+                    winners = parallel_search.play_out(game_state, self.rollouts_per_leaf)
+                    # The same rewards as Node.rollout()
+                    reward = sum(-1 if winner == current_player else 0 if winner == 0 else 1 for winner in winners)
+                    visits = len(winners)
+                with lock:
+                    self.add_virtual_loss(path, -1)
+                    for node, parent_node, slot in zip(path, path[1:], slots):
+                        # Another thread may have pointed a shared node of the transposition table to another parent
+                        node.parent_node = parent_node
+                        node.slot = slot
+                    target_node.back_propagation(reward, visits)
+
+        workers = [threading.Thread(target=run_simulations) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return started[0]
+
+    def select_path(self):
+        """ Return the nodes from the node to roll out up to the root node, after the selection and expansion of a simulation """
+        target_node = self.selection()
+        if target_node.visited_times != 0 and target_node.game_state.winner is None and not self.is_full():
+            target_node.expand()
+            target_node = target_node.get_next_child_node()
+        path = []
+        node = target_node
+        while node is not None:
+            path.append(node)
+            node = node.parent_node
+        return path
+
+    def add_virtual_loss(self, path, sign):
+        """ Add (sign 1) or remove (sign -1) a visit with a loss of config.virtual_loss to the nodes of path """
+        for node in path:
+            node.visited_times += sign
+            node.total_reward -= sign * config.virtual_loss
+            node.update_parent_arrays()
 
 class Node:
     """
     Represents a node in the tree formed during the MCTS
     """
-    def __init__(self, game_state, move, parent_node, player_id):
+    def __init__(self, game_state, parent_node, player_id):
         self.total_reward = 0
         self.visited_times = 0
-        self.game_state = game_state
-        self.move = move
+        # None if the game state is rebuilt from the parent node, see game_state
+        self._game_state = game_state
         self.child_nodes = []
+        # The legal moves once the node is expanded, children[i] is the child node of legal_moves[i] or None until
+        # selection first takes it
+        self.legal_moves = None
+        self.children = None
+        # Statistics of the children in the order of legal_moves, so that the selection reads them from two lists,
+        # see select_slot()
+        self.child_visits = None
+        self.child_rewards = None
+        # The index of this node in the children of its parent node, the move to this node is kept there, see move
+        self.slot = None
+        # A child node proven to win for the player to move, kept by MCTSSolverNode, see MCTS.get_proven_win_node()
+        self.proven_child = None
         self.parent_node = parent_node
         self.player_id = player_id
+        self.transposition_table = None
+        # The number of nodes of the tree as a one-element list shared by all its nodes, see MCTS.get_number_of_nodes()
+        if parent_node is None:
+            self.tree_size = [1]
+        else:
+            self.tree_size = parent_node.tree_size
+            self.tree_size[0] += 1
+
+    @property
+    def move(self):
+        """
+        The move from the parent node to this node, None for the root node
+
+        It is read from the legal moves of the parent node, so a node shared by a transposition table has the move of
+        the parent node it is reached from.
+        """
+        if self.parent_node is None:
+            return None
+        return self.parent_node.legal_moves[self.slot]
+
+    @property
+    def game_state(self):
+        """
+        The game state of the node
+
+        The root node and the nodes visited at least config.keep_game_state_visits times keep their game state. The
+        other nodes rebuild it by replaying the moves from the closest ancestor that keeps one. A leaf node keeps it
+        until the rollout takes it, or until its first child is created.
+        """
+        if self._game_state is not None:
+            return self._game_state
+        path = []
+        node = self
+        while node._game_state is None:
+            path.append(node)
+            node = node.parent_node
+        game_state = node._game_state.clone()
+        for node in reversed(path):
+            game_state.apply_legal_move(node.move[0], node.move[1])
+            if node is not self and node.visited_times >= config.keep_game_state_visits:
+                node._game_state = game_state.clone()
+        if self.legal_moves is None or self.visited_times >= config.keep_game_state_visits:
+            self._game_state = game_state
+        return game_state
+
+    def keep_game_state(self):
+        """ Keep the game state in the node, e.g. before it becomes the root node """
+        self._game_state = self.game_state
+
+    def take_game_state(self):
+        """
+        Return a game state of the node that can be changed, e.g. by a rollout
+
+        A node that does not have to keep its game state gives it away instead of copying it.
+        """
+        game_state = self.game_state
+        if self.parent_node is None or self.visited_times >= config.keep_game_state_visits:
+            return game_state.clone()
+        self._game_state = None
+        return game_state
+
+    def release_game_state(self):
+        """ Drop the game state of an expanded node that is not the root node and not visited often """
+        if self.parent_node is not None and self.visited_times < config.keep_game_state_visits:
+            self._game_state = None
+
+    def is_expanded(self):
+        return self.legal_moves is not None
+
+    def release(self):
+        """ Drop the references of a node removed from the tree, so that it is freed at once instead of by the garbage collector """
+        self.parent_node = None
+        self.child_nodes = []
+        self.children = None
+        self.proven_child = None
+        self._game_state = None
 
     def rollout(self):
         """ 
@@ -82,28 +369,130 @@ class Node:
 
         Return the reward. (-1 if leaf node's current player wins, 0 is draw, 1 if leaf node's current player losses)
         """
-        game_state_copy = deepcopy(self.game_state)
-        while game_state_copy.winner is None:
-            legal_moves = game_state_copy.get_legal_moves()
-            main_board_coor, sub_board_coor = random.choice(legal_moves)
-            game_state_copy.make_move(main_board_coor, sub_board_coor)
-        if game_state_copy.winner == self.game_state.current_player:
+        current_player = self.game_state.current_player
+        winner = self.take_game_state().play_random_game()
+        if winner == current_player:
             # This leaf mode's current player wins
             return -1
-        elif game_state_copy.winner == 0:
+        elif winner == 0:
             return 0
         else:
             return 1
 
     def expand(self):
-        """ Create child nodes """
-        if not self.child_nodes:
-            legal_moves = self.game_state.get_legal_moves()
-            for move in legal_moves:
-                child_game_state = deepcopy(self.game_state)
-                child_game_state.make_move(move[0], move[1])
-                self.child_nodes.append(self.get_new_node(child_game_state, move, self, self.player_id))
-    
+        """ Record the legal moves, their child nodes are created when selection first takes them """
+        if self.legal_moves is None:
+            self.legal_moves = self.game_state.get_legal_moves()
+            self.children = [None] * len(self.legal_moves)
+            self.child_visits = [0] * len(self.legal_moves)
+            self.child_rewards = [0] * len(self.legal_moves)
+
+    def has_untried_moves(self):
+        """ Return True if some legal move has no child node yet """
+        return len(self.child_nodes) < len(self.legal_moves)
+
+    def get_next_child_node(self):
+        """ Return the child node to visit after expanding, the one of the first move without a child node if any """
+        if self.has_untried_moves():
+            return self.create_child_node(self.children.index(None))
+        return self.child_nodes[0]
+
+    def get_child_node(self, move):
+        """ Return the child node of a move, creating it if needed, or None if move is not legal """
+        if self.legal_moves is None or move not in self.legal_moves:
+            return None
+        slot = self.legal_moves.index(move)
+        if self.children[slot] is not None:
+            return self.children[slot]
+        return self.create_child_node(slot)
+
+    def create_child_node(self, slot):
+        """ Create the child node of legal_moves[slot] with its game state, the game state of this node is released afterwards """
+        move = self.legal_moves[slot]
+        child_game_state = self.game_state.clone()
+        child_game_state.apply_legal_move(move[0], move[1])
+        child_node = self.add_child_node(child_game_state, slot)
+        self.release_game_state()
+        return child_node
+
+    def add_child_node(self, game_state, slot):
+        """
+        Add the child node of legal_moves[slot], and return it
+
+        With a transposition table, the node of the same position is reused if there is one, whatever the move and the
+        parent node it was reached from.
+        """
+        table = self.transposition_table
+        if table is not None:
+            key = game_state.zobrist_key
+            child_node = table.get(key)
+            if child_node is not None:
+                child_node.parent_node = self
+                self.set_child_node(slot, child_node)
+                return child_node
+        child_node = self.get_new_node(game_state, self, self.player_id)
+        child_node.transposition_table = table
+        if table is not None:
+            table.store(key, child_node)
+        self.set_child_node(slot, child_node)
+        return child_node
+
+    def set_child_node(self, slot, child_node):
+        """ Make child_node the child node of legal_moves[slot] """
+        child_node.slot = slot
+        self.children[slot] = child_node
+        self.child_nodes.append(child_node)
+        self.child_visits[slot] = child_node.visited_times
+        self.child_rewards[slot] = child_node.total_reward
+
+    def update_parent_arrays(self):
+        """ Copy the statistics of this node to the child arrays of its parent node, unused with a transposition table """
+        if self.parent_node is not None and self.transposition_table is None:
+            self.parent_node.child_visits[self.slot] = self.visited_times
+            self.parent_node.child_rewards[self.slot] = self.total_reward
+
+    def select_slot(self):
+        """
+        Return the index in legal_moves of the child with the best UCB1, the first one if several are the best
+
+        The UCB1 values are computed from the child lists, with the log of the visited times of this node computed
+        once. A move without a child node has not been visited and has an infinite UCB1.
+        """
+        log_visited_times = math.log(max(self.visited_times, 1))
+        best_slot = 0
+        max_UCB1 = -math.inf
+        for slot, (visited_times, total_reward) in enumerate(zip(self.child_visits, self.child_rewards)):
+            if visited_times == 0:
+                return slot
+            UCB1 = total_reward / visited_times + config.exploration_weight * math.sqrt(log_visited_times / visited_times)
+            if UCB1 > max_UCB1:
+                if UCB1 == math.inf:
+                    return slot
+                best_slot = slot
+                max_UCB1 = UCB1
+        return best_slot
+
+    def select_shared_slot(self):
+        """
+        Return the index in legal_moves of the child with the best UCB1 like select_slot(), with a transposition table
+
+        The child arrays of this node are not updated through the other parent nodes of a shared child node, so the
+        statistics are read from the child nodes instead.
+        """
+        log_visited_times = math.log(max(self.visited_times, 1))
+        best_slot = 0
+        max_UCB1 = -math.inf
+        for slot, child_node in enumerate(self.children):
+            if child_node is None or child_node.visited_times == 0:
+                return slot
+            UCB1 = child_node.total_reward / child_node.visited_times + config.exploration_weight * math.sqrt(log_visited_times / child_node.visited_times)
+            if UCB1 > max_UCB1:
+                if UCB1 == math.inf:
+                    return slot
+                best_slot = slot
+                max_UCB1 = UCB1
+        return best_slot
+
     def compute_UCB1(self):
         """ Compute the UCB1 value """
         if self.visited_times == 0:
@@ -111,12 +500,22 @@ class Node:
         UCB1 = (self.total_reward / self.visited_times) + config.exploration_weight * math.sqrt(math.log(self.parent_node.visited_times) / self.visited_times)
         return UCB1
 
-    def back_propagation(self, reward):
-        """ Update the visited_times and total_reward of the current node, and also its parent node, until the root node is reached """
-        self.visited_times += 1
-        self.total_reward += reward
-        if self.parent_node is not None:
-            self.parent_node.back_propagation(-reward)
+    def back_propagation(self, reward, visits=1):
+        """
+        Update the visited_times and total_reward of the current node, and also its parent node, until the root node is reached
+
+        visits is the number of rollouts that reward is the sum of, see MCTS.rollout_leaf().
+
+        The nodes are updated in a loop along the parent nodes, which are the path of the selection (see MCTS.selection()
+        for the transposition table), so a long path does not need one stack frame per node.
+        """
+        node = self
+        while node is not None:
+            node.visited_times += visits
+            node.total_reward += reward
+            node.update_parent_arrays()
+            reward = -reward
+            node = node.parent_node
     
-    def get_new_node(self, game_state, move, parent_node, player_id):
-        return Node(game_state, move, parent_node, player_id)
+    def get_new_node(self, game_state, parent_node, player_id):
+        return Node(game_state, parent_node, player_id)
@@ -17,7 +17,9 @@ class NeuralNetwork():
         and https://github.com/blanyal/alpha-zero with a little modification.
         It is just for testing the implementation of my program, I may change the architecture in the future.
     """
-    def __init__(self):
+    def __init__(self, board_size=config.board_size):
+        # One policy output per move id, see utils.MoveTable
+        self.number_of_moves = board_size ** 4
         self.model = None
         self.new_network()
 
@@ -31,8 +33,8 @@ class NeuralNetwork():
 
             return x
 
-        # Input shape is 81(player1) + 81(player2) + 81(legal_moves, i.e. [0,0,0,1,1,0,...]) + 1(current player - 1)
-        visible = keras.layers.Input(shape=(81+81+81+1))
+        # Input shape is 81(player1) + 81(player2) + 81(legal_moves, i.e. [0,0,0,1,1,0,...]) + 1(current player - 1) for board size 3
+        visible = keras.layers.Input(shape=(3 * self.number_of_moves + 1))
         x = Dense(1024, activation='relu', kernel_regularizer=regularizers.l2(config.c))(visible)
 
         # # 10 resnet blocks
@@ -40,7 +42,7 @@ class NeuralNetwork():
         #     x = resnet_block(x)
 
         policy_hidden = Dense(256, activation='relu', kernel_regularizer=regularizers.l2(config.c))(x)
-        policy_output = Dense(81, activation='softmax', kernel_regularizer=regularizers.l2(config.c), name='policy')(policy_hidden)
+        policy_output = Dense(self.number_of_moves, activation='softmax', kernel_regularizer=regularizers.l2(config.c), name='policy')(policy_hidden)
 
         value_hidden = Dense(256, activation='relu', kernel_regularizer=regularizers.l2(config.c))(x)
         value_output = Dense(1, activation='tanh', kernel_regularizer=regularizers.l2(config.c), name='value')(value_hidden)
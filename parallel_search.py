@@ -0,0 +1,114 @@
+import atexit
+import math
+import multiprocessing
+import random
+import time
+
+# Worker pools by number of workers, kept for the whole game so that processes are not started for every move
+_pools = {}
+
+
+def get_pool(workers):
+    """ Return a process pool with a number of workers, creating it on first use """
+    if workers not in _pools:
+        _pools[workers] = multiprocessing.Pool(workers)
+    return _pools[workers]
+
+
+def close_pools():
+    for pool in _pools.values():
+        pool.terminate()
+    _pools.clear()
+
+
+atexit.register(close_pools)
+
+
+def search_root(tree_class, tree_args, game_state, player_id, number_of_simulations, time_limit, seed, stop_when_proven):
+    """
+    Run one search from game_state in a worker process
+
+    The tree is tree_class(game_state, player_id, *tree_args). Return the move, visited_times and total_reward of each
+    child node of the root node. The first simulation always runs, so that the root node has a child node to report.
+    """
+    start_time = time.time()
+    random.seed(seed)
+    tree = tree_class(game_state, player_id, *tree_args)
+    for i in range(max(number_of_simulations, 1)):
+        if i != 0 and time_limit is not None and time.time() - start_time >= time_limit:
+            break
+        if stop_when_proven and tree.get_proven_win_node() is not None:
+            break
+        tree.simulation()
+    return [(child_node.move, child_node.visited_times, child_node.total_reward) for child_node in tree.root_node.child_nodes]
+
+
+def play_out(game_state, number_of_rollouts, seed=None):
+    """ Play number_of_rollouts random games from game_state, which is not changed, and return the list of their winners """
+    if seed is not None:
+        random.seed(seed)
+    winners = []
+    for _ in range(number_of_rollouts):
+        winners.append(game_state.clone().play_random_game())
+    return winners
+
+
+def play_out_in_parallel(workers, game_state, number_of_rollouts):
+    """
+    Leaf parallelisation: play number_of_rollouts random games from game_state, split over the worker processes, and
+    return the list of their winners
+    """
+    if workers == 1:
+        return play_out(game_state, number_of_rollouts)
+    pool = get_pool(workers)
+    tasks = [(game_state, number_of_rollouts // workers + (1 if i < number_of_rollouts % workers else 0), random.getrandbits(64))
+             for i in range(min(workers, number_of_rollouts))]
+    return [winner for winners in pool.starmap(play_out, tasks) for winner in winners]
+
+
+def merge_root_statistics(results):
+    """
+    Return a dict from each move to its visited_times and total_reward summed over the results of search_root()
+
+    A proven win (+math.inf) or loss (-math.inf) of a move in any search holds for all of them, so it replaces the sum.
+    """
+    statistics = {}
+    for result in results:
+        for move, visited_times, total_reward in result:
+            if move not in statistics:
+                statistics[move] = [0, 0]
+            statistics[move][0] += visited_times
+            if statistics[move][1] == math.inf or statistics[move][1] == -math.inf:
+                continue
+            if total_reward == math.inf or total_reward == -math.inf:
+                statistics[move][1] = total_reward
+            else:
+                statistics[move][1] += total_reward
+    return statistics
+
+
+def get_best_move(statistics, legal_moves):
+    """ Return the visited move with the best average reward, like MCTS.get_best_node(), or the first legal move if none is visited """
+    best_move = None
+    max_reward = None
+    for move, (visited_times, total_reward) in statistics.items():
+        if visited_times != 0:
+            reward = total_reward / visited_times
+            if max_reward is None or reward > max_reward:
+                best_move = move
+                max_reward = reward
+    if best_move is None:
+        return legal_moves[0]
+    return best_move
+
+
+def search_in_parallel(workers, tree_class, tree_args, game_state, player_id, number_of_simulations, time_limit, stop_when_proven=False):
+    """
+    Root parallelisation: run one independent search from game_state in each of the worker processes, each with the
+    full number_of_simulations and time_limit, and return the best move of their merged root statistics
+    """
+    pool = get_pool(workers)
+    tasks = [(tree_class, tree_args, game_state, player_id, number_of_simulations, time_limit, random.getrandbits(64), stop_when_proven)
+             for _ in range(workers)]
+    results = pool.starmap(search_root, tasks)
+    return get_best_move(merge_root_statistics(results), game_state.get_legal_moves())
@@ -1,16 +1,21 @@
 from main_board import MainBoard
+from bitboard import BitBoard
 from monte_carlo_tree_search import MCTS
 from mc_rave import MCRAVE
 from heuristic_mc_rave import HMCRAVE
 from mcts_solver import MCTSSolver
 from mcts_alpha import MCTSAlpha
+from score_bounded_mcts import ScoreBoundedMCTS
+from array_tree import ArrayMCTS, ArrayMCTSSolver, ArrayMCRAVE
+from transposition_table import TranspositionTable
+from time_manager import TimeManager
+import parallel_search
 import config
 import sys
 import random
 import re
-from copy import deepcopy
+import threading
 import time
-import math
 
 
 class Player:
@@ -56,7 +61,7 @@ class HumanPlayer(Player):
     def get_move(self):
         coor_format = re.compile('^\d,\d$')
         while True:
-            print("Legal sub-boards:", self.main_board.allowed_sub_boards)
+            print("Legal sub-boards:", sorted(self.main_board.allowed_sub_boards))
             while True:
                 input_1 = input("Please input the coordinate of a sub-board: ")
                 if coor_format.match(input_1) is None:
@@ -86,42 +91,297 @@ class MCTSPlayer(Player):
     A player that uses the Monte Carlo Tree Search to choose a move that is more likely to win
     """
 
-    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit):
+    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit, use_bitboard=config.use_bitboard, use_transposition_table=config.use_transposition_table, use_array_tree=config.use_array_tree, workers=config.workers, rollouts_per_leaf=config.rollouts_per_leaf, rollout_workers=config.rollout_workers, threads=config.threads, ponder=config.ponder, total_time=config.total_time):
         super().__init__(main_board)
         # To check whether this player has won in a simulation
         self.player_id = player_id
         self.num_of_simulation = num_of_simulation
         self.time_limit = time_limit
-        self.tree = MCTS(deepcopy(self.main_board), self.player_id)
+        self.use_bitboard = use_bitboard
+        self.use_transposition_table = use_transposition_table
+        self.use_array_tree = use_array_tree
+        # With more than one worker, each move is searched by that many processes, see search_in_parallel()
+        self.workers = workers
+        # Each leaf node selected by the object trees is scored by rollouts_per_leaf rollouts in rollout_workers processes
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_workers = rollout_workers
+        # With more than one thread, the simulations of the object trees run in threads sharing the tree
+        self.threads = threads
+        # Keep searching from the root node while the opponent thinks, see start_pondering()
+        self.ponder = ponder
+        self.ponder_thread = None
+        self.ponder_stop = threading.Event()
+        # The number of simulations run during the last turn of the opponent
+        self.ponder_simulations = 0
+        # With a total time for the game, the time of each move is set by the time manager instead of
+        # num_of_simulation and time_limit
+        self.time_manager = None if total_time is None else TimeManager(total_time, main_board.board_size)
+        self.tree = self.create_tree()
         self.best_node = self.tree.root_node
+        # The nodes kept from the last search and released since then, see update_root()
+        self.reused_nodes = 0
+        self.freed_nodes = 0
+        # The rollouts saved by stopping the search early in the last move and in the game, see run_simulations()
+        self.saved_rollouts = 0
+        self.total_saved_rollouts = 0
+
+    def create_tree(self):
+        """ Return a new search tree with the position of the main board at its root node """
+        if self.use_array_tree:
+            return ArrayMCTS(self.get_search_state(), self.player_id)
+        return MCTS(self.get_search_state(), self.player_id, self.get_transposition_table(), self.rollouts_per_leaf, self.rollout_workers)
+
+    def get_search_state(self):
+        """ Return a copy of the main board for the search tree, as a BitBoard if use_bitboard is set """
+        if self.use_bitboard:
+            return BitBoard.from_main_board(self.main_board)
+        return self.main_board.clone()
+
+    def get_transposition_table(self):
+        """ Return a new transposition table for the search tree if use_transposition_table is set, None otherwise """
+        if self.use_transposition_table:
+            return TranspositionTable(config.transposition_table_size)
+        return None
+
+    def get_tree_args(self):
+        """ Return the arguments of the search tree class after the root game state and the player id """
+        if type(self.tree) in (MCTS, MCTSSolver):
+            # The rollouts of a leaf node run in the worker process itself, worker processes cannot start their own pool
+            return (self.get_transposition_table(), self.rollouts_per_leaf, 1)
+        return ()
 
-    def get_opponent_move(self):
-        for x_main in range(self.main_board.board_size):
-            for y_main in range(self.main_board.board_size):
-                for x_sub in range(self.main_board.board_size):
-                    for y_sub in range(self.main_board.board_size):
-                        if self.best_node.game_state.sub_boards[y_main][x_main].cells[y_sub][x_sub] != self.main_board.sub_boards[y_main][x_main].cells[y_sub][x_sub]:
-                            return ((y_main, x_main), (y_sub, x_sub))
+    def search_in_parallel(self, start_time, stop_when_proven=False):
+        """
+        Search from the root node in self.workers processes, and return the best move of their merged statistics
+
+        The root node of self.tree moves to the child node of the returned move, but the searches of the workers are not
+        kept in self.tree. If the time of the move is already spent, the workers are not started and the move is chosen
+        by one simulation on self.tree instead.
+        """
+        time_limit = self.get_time_limit(start_time)
+        if time_limit is not None and time_limit <= 0:
+            self.tree.simulation()
+            self.best_node = self.tree.get_best_node()
+            return self.best_node.move
+        best_move = parallel_search.search_in_parallel(self.workers, type(self.tree), self.get_tree_args(), self.tree.root_node.game_state,
+                                                       self.player_id, self.get_number_of_simulations(), time_limit, stop_when_proven)
+        if not self.tree.root_node.is_expanded():
+            self.tree.root_node.expand()
+        self.best_node = self.tree.root_node.get_child_node(best_move)
+        return best_move
+
+    def get_forced_move(self):
+        """ Return the only legal move if there is no choice, None otherwise, so that a forced move is not searched """
+        legal_moves = self.main_board.get_legal_moves()
+        if len(legal_moves) == 1:
+            return legal_moves[0]
         return None
 
-    def get_move(self):
+    def get_number_of_simulations(self):
+        """ Return the maximum number of simulations of a move, which is not limited with a time manager """
+        if self.time_manager is not None:
+            return sys.maxsize
+        return self.num_of_simulation
+
+    def get_time_limit(self, start_time):
+        """ Return the time left for the search of the current move, or None if it has no time limit """
+        if self.time_manager is not None:
+            return self.time_manager.get_time_left()
+        if self.time_limit is None:
+            return None
+        return self.time_limit - (time.time() - start_time)
+
+    def is_out_of_time(self, start_time):
+        """ Return True if the search of the current move must stop, see run_simulations() """
+        if self.time_manager is not None:
+            return self.time_manager.should_stop(self.tree.root_node)
+        return self.time_limit is not None and time.time() - start_time >= self.time_limit
+
+    def run_simulations(self, start_time, stop_when_proven=False):
+        """
+        Run the simulations of the current move on self.tree, and return the child node of the root node that is proven
+        to win if stop_when_proven is set and one is found, None otherwise
+
+        The clock is checked before the first simulation and then every config.time_check_interval simulations, so a
+        move without time runs no simulation. The early stopping rule (see can_stop_early()) is checked with the clock
+        after the first simulation. The rollouts left when the search stops early are counted in saved_rollouts.
+        """
+        for i in range(self.get_number_of_simulations()):
+            if i % config.time_check_interval == 0:
+                if self.is_out_of_time(start_time):
+                    break
+                if i != 0 and config.early_stop and self.can_stop_early(i, start_time):
+                    self.add_saved_rollouts(i, start_time)
+                    break
+            if stop_when_proven:
+                # Early stop
+                proven_node = self.tree.get_proven_win_node()
+                if proven_node is not None:
+                    self.add_saved_rollouts(i, start_time)
+                    return proven_node
+            self.tree.simulation()
+        return None
+
+    def get_simulations_left(self, simulations_run, start_time):
+        """ Return the estimated number of simulations the current move could still run, within its time at the speed so far """
+        simulations_left = self.get_number_of_simulations() - simulations_run
+        if self.time_manager is not None:
+            time_left = self.time_manager.get_time_to_deadline()
+        elif self.time_limit is not None:
+            time_left = self.time_limit - (time.time() - start_time)
+        else:
+            return simulations_left
+        elapsed_time = time.time() - start_time
+        speed = simulations_run / elapsed_time if elapsed_time > 0 else 0
+        return min(simulations_left, int(speed * max(time_left, 0)))
+
+    def can_stop_early(self, simulations_run, start_time):
+        """
+        Return True if the search of the current move can stop before its budget is spent
+
+        The most visited child node of the root node must be the best node (see get_best_node()), and either no other
+        child node can reach its visits in the simulations left, each adding rollouts_per_leaf visits, or it has
+        config.early_stop_visit_share of the visits of the child nodes.
+        """
+        most_visited_node = None
+        most_visits = 0
+        second_most_visits = 0
+        total_visits = 0
+        for child_node in self.tree.root_node.child_nodes:
+            visited_times = child_node.visited_times
+            total_visits += visited_times
+            if visited_times > most_visits:
+                most_visited_node = child_node
+                second_most_visits = most_visits
+                most_visits = visited_times
+            elif visited_times > second_most_visits:
+                second_most_visits = visited_times
+        if most_visited_node is None or most_visited_node.move != self.tree.get_best_node().move:
+            return False
+        if most_visits >= config.early_stop_visit_share * total_visits:
+            return True
+        visits_left = self.get_simulations_left(simulations_run, start_time) * self.tree.rollouts_per_leaf
+        return most_visits - second_most_visits > visits_left
+
+    def add_saved_rollouts(self, simulations_run, start_time):
+        """ Count the rollouts of the simulations left when the search of the current move stops early """
+        saved_rollouts = self.get_simulations_left(simulations_run, start_time) * self.tree.rollouts_per_leaf
+        self.saved_rollouts += saved_rollouts
+        self.total_saved_rollouts += saved_rollouts
+
+    def uses_tree_parallel(self):
+        """ Return True if the simulations run in several threads, see MCTS.run_tree_parallel() """
+        return self.threads > 1 and type(self.tree) in (MCTS, MCTSSolver)
+
+    def start_pondering(self):
+        """
+        Run simulations on the root node in a background thread until stop_pondering() is called
+
+        The root node is the position after this player's move, so the statistics of the child node of the opponent's
+        move are kept when get_move() makes it the root node.
+        """
+        if self.tree.root_node.game_state.winner is not None:
+            return
+        self.ponder_stop.clear()
+        self.ponder_simulations = 0
+        self.ponder_thread = threading.Thread(target=self.run_ponder_simulations, daemon=True)
+        self.ponder_thread.start()
+
+    def run_ponder_simulations(self):
+        for _ in range(config.max_ponder_simulations):
+            # The game may end with the opponent's move, then get_move() is not called again
+            if self.ponder_stop.is_set() or self.main_board.winner is not None:
+                break
+            self.tree.simulation()
+            self.ponder_simulations += 1
+
+    def stop_pondering(self):
+        """ Stop the simulations started by start_pondering() and wait for the last one to finish """
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+
+    def get_moves_since_root(self):
+        """ Return the moves made on the main board since the position of the root node, or None if they are not known """
+        history = self.main_board.move_history
+        root_move_count = self.tree.root_node.game_state.current_move
+        # A main board with moves that were not made with make_move() has a shorter history
+        if len(history) != self.main_board.current_move or root_move_count > len(history):
+            return None
+        return history[root_move_count:]
+
+    def update_root(self):
+        """
+        Make the node of the position of the main board the root node of the tree, and return the number of nodes released
+
+        Each move since the position of the root node is a direct child lookup, and the nodes outside of the new subtree
+        are released (see MCTS.move_root()). If the position is not in the tree, the tree is built again, so that the
+        search never runs on an old position.
+        """
+        node = self.tree.root_node
+        moves = self.get_moves_since_root()
+        if moves is None:
+            # The moves since the root node are not known, e.g. they were pushed on the main board
+            released = self.tree.get_number_of_nodes()
+            self.tree = self.create_tree()
+            self.freed_nodes += released
+            return released
+        if not moves:
+            return 0
+        for move in moves:
+            if not node.is_expanded():
+                node.expand()
+                node.visited_times += 1
+            node = node.get_child_node(move)
+            if node is None:
+                break
+        if node is None:
+            released = self.tree.get_number_of_nodes()
+            self.tree = self.create_tree()
+        else:
+            released = self.tree.move_root(node)
+        self.freed_nodes += released
+        return released
+
+    def get_search_report(self):
+        """ Return a line about the nodes of the tree and the rollouts saved by stopping early for the last move """
+        return "Nodes reused: " + str(self.reused_nodes) + ", freed: " + str(self.freed_nodes) + ", in tree: " + \
+            str(self.tree.get_number_of_nodes()) + " (about " + str(round(self.tree.get_nbytes() / 1024)) + " KB)" + \
+            ", rollouts saved: " + str(self.saved_rollouts) + " (" + str(self.total_saved_rollouts) + " this game)"
+
+    def start_move(self):
+        """ Start the clock of the move, then update the root node, and return the start time """
         start_time = time.time()
+        if self.time_manager is not None:
+            self.time_manager.start_move(self.main_board)
+        self.stop_pondering()
         # Update root node to the node after opponent moved
-        if not self.tree.root_node.child_nodes:
+        self.freed_nodes = 0
+        self.saved_rollouts = 0
+        self.update_root()
+        self.reused_nodes = self.tree.get_number_of_nodes()
+        if not self.tree.root_node.is_expanded():
             self.tree.root_node.expand()
             self.tree.root_node.visited_times += 1
-        for node in self.tree.root_node.child_nodes:
-            if node.move == self.get_opponent_move():
-                self.tree.root_node = node
-                self.tree.root_node.parent_node = None
-                break
+        return start_time
+
+    def get_move(self):
+        start_time = self.start_move()
+
+        forced_move = self.get_forced_move()
+        if forced_move is not None:
+            self.best_node = self.tree.root_node.get_child_node(forced_move)
+            return forced_move
+
+        if self.workers > 1:
+            return self.search_in_parallel(start_time)
 
        # Run simulations
-        if self.num_of_simulation != 0:
-            for _ in range(self.num_of_simulation):
-                if self.time_limit is not None and time.time() - start_time >= self.time_limit:
-                    break
-                self.tree.simulation()
+        if self.uses_tree_parallel():
+            self.tree.run_tree_parallel(self.threads, self.get_number_of_simulations(), self.get_time_limit(start_time))
+        elif self.num_of_simulation != 0 or self.time_manager is not None:
+            self.run_simulations(start_time)
 
         self.best_node = self.tree.get_best_node()
         best_move = self.best_node.move
@@ -133,56 +393,70 @@ class MCTSPlayer(Player):
         """ If a move is made successfully, return True, else return False """
         result = self.main_board.make_move(main_board_coor, sub_board_coor)
         if result:
-            # Update self.tree, so that the root node is the chosen child node of the original root node
+            # Update self.tree, so that the root node is the child node of the move
             # At this moment, opponent is the current_player
-            self.tree.root_node = self.best_node
-            self.tree.root_node.parent_node = None
+            self.update_root()
+            # The clock of this player runs from get_move() until its move is made and the tree is updated
+            if self.time_manager is not None:
+                self.time_manager.end_move()
+            # The searches of the worker processes are not kept in self.tree, so there is nothing to ponder on
+            if self.ponder and self.workers == 1:
+                self.start_pondering()
         return result
 
 
 class MCRAVEPlayer(MCTSPlayer):
-    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit):
-        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit)
-        self.tree = MCRAVE(deepcopy(self.main_board), self.player_id)
+    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit, use_bitboard=config.use_bitboard, use_array_tree=config.use_array_tree, total_time=config.total_time):
+        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit, use_bitboard=use_bitboard, use_array_tree=use_array_tree, total_time=total_time)
+
+    def create_tree(self):
+        if self.use_array_tree:
+            return ArrayMCRAVE(self.get_search_state(), self.player_id)
+        return MCRAVE(self.get_search_state(), self.player_id)
 
 
 class HMCRAVEPlayer(MCTSPlayer):
-    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit):
-        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit)
-        self.tree = HMCRAVE(deepcopy(self.main_board), self.player_id)
+    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit, use_bitboard=config.use_bitboard, total_time=config.total_time):
+        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit, use_bitboard=use_bitboard, total_time=total_time)
+
+    def create_tree(self):
+        return HMCRAVE(self.get_search_state(), self.player_id)
 
 
 class MCTSSolverPlayer(MCTSPlayer):
-    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit):
-        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit)
-        self.tree = MCTSSolver(deepcopy(self.main_board), self.player_id)
+    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit, use_bitboard=config.use_bitboard, use_transposition_table=config.use_transposition_table, use_array_tree=config.use_array_tree, workers=config.workers, rollouts_per_leaf=config.rollouts_per_leaf, rollout_workers=config.rollout_workers, threads=config.threads, ponder=config.ponder, total_time=config.total_time):
+        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit, use_bitboard=use_bitboard, use_transposition_table=use_transposition_table, use_array_tree=use_array_tree, workers=workers,
+                         rollouts_per_leaf=rollouts_per_leaf, rollout_workers=rollout_workers, threads=threads, ponder=ponder, total_time=total_time)
+
+    def create_tree(self):
+        if self.use_array_tree:
+            return ArrayMCTSSolver(self.get_search_state(), self.player_id)
+        return MCTSSolver(self.get_search_state(), self.player_id, self.get_transposition_table(), self.rollouts_per_leaf, self.rollout_workers)
 
     def get_move(self):
-        start_time = time.time()
-        # Update root node to the node after opponent moved
-        if not self.tree.root_node.child_nodes:
-            self.tree.root_node.expand()
-            self.tree.root_node.visited_times += 1
-        for node in self.tree.root_node.child_nodes:
-            if node.move == self.get_opponent_move():
-                self.tree.root_node = node
-                self.tree.root_node.parent_node = None
-                break
-        # Run simulations
-        if self.num_of_simulation != 0:
-            for i in range(self.num_of_simulation):
-                if self.time_limit is not None and time.time() - start_time >= self.time_limit:
-                    break
+        start_time = self.start_move()
 
-                for child_node in self.tree.root_node.child_nodes:
-                    # Early stop
-                    if child_node.total_reward == math.inf:
-                        self.best_node = child_node
-                        return child_node.move
-                
-                # a = time.time()
-                self.tree.simulation()
-                # print("Simulation: ", time.time() - a)
+        forced_move = self.get_forced_move()
+        if forced_move is not None:
+            self.best_node = self.tree.root_node.get_child_node(forced_move)
+            return forced_move
+
+        if self.workers > 1:
+            # A worker stops once it proves a winning move
+            return self.search_in_parallel(start_time, stop_when_proven=True)
+
+        # Run simulations
+        if self.uses_tree_parallel():
+            self.tree.run_tree_parallel(self.threads, self.get_number_of_simulations(), self.get_time_limit(start_time), stop_when_proven=True)
+            proven_node = self.tree.get_proven_win_node()
+            if proven_node is not None:
+                self.best_node = proven_node
+                return proven_node.move
+        elif self.num_of_simulation != 0 or self.time_manager is not None:
+            proven_node = self.run_simulations(start_time, stop_when_proven=True)
+            if proven_node is not None:
+                self.best_node = proven_node
+                return proven_node.move
 
         self.best_node = self.tree.get_best_node()
         best_move = self.best_node.move
@@ -190,37 +464,61 @@ class MCTSSolverPlayer(MCTSPlayer):
         # print(self.player_id, end_time - start_time)
         return best_move
 
+class ScoreBoundedPlayer(MCTSPlayer):
+    def __init__(self, main_board, player_id, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit, use_bitboard=config.use_bitboard, ponder=config.ponder, total_time=config.total_time):
+        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit, use_bitboard=use_bitboard, ponder=ponder, total_time=total_time)
+
+    def create_tree(self):
+        return ScoreBoundedMCTS(self.get_search_state(), self.player_id, self.rollouts_per_leaf, self.rollout_workers)
+
+    def get_move(self):
+        start_time = self.start_move()
+
+        forced_move = self.get_forced_move()
+        if forced_move is not None:
+            self.best_node = self.tree.root_node.get_child_node(forced_move)
+            return forced_move
+
+        # Run simulations, the search stops once the root node is solved
+        if self.num_of_simulation != 0 or self.time_manager is not None:
+            self.run_simulations(start_time, stop_when_proven=True)
+
+        self.best_node = self.tree.get_best_node()
+        return self.best_node.move
+
 class MCTSAlphaPlayer(MCTSSolverPlayer):
-    def __init__(self, main_board, player_id, net, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit):
-        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit)
-        self.tree = MCTSAlpha(deepcopy(self.main_board), self.player_id, net)
+    def __init__(self, main_board, player_id, net, num_of_simulation=config.number_of_simulations, time_limit=config.time_limit, use_bitboard=config.use_bitboard):
+        # The network is needed by create_tree()
+        self.net = net
+        super().__init__(main_board, player_id, num_of_simulation=num_of_simulation, time_limit=time_limit, use_bitboard=use_bitboard, workers=1, ponder=False)
         self.turn = player_id - 1
 
+    def create_tree(self):
+        return MCTSAlpha(self.get_search_state(), self.player_id, self.net)
+
     def get_prob(self):
         return self.tree.get_prob()
 
     def get_move(self, training_mode=False):
         start_time = time.time()
         # Update root node to the node after opponent moved
-        if not self.tree.root_node.child_nodes:
+        self.freed_nodes = 0
+        self.update_root()
+        self.reused_nodes = self.tree.get_number_of_nodes()
+        if not self.tree.root_node.is_expanded():
             self.tree.root_node.expand()
             self.tree.root_node.visited_times += 1
-        for node in self.tree.root_node.child_nodes:
-            if node.move == self.get_opponent_move():
-                self.tree.root_node = node
-                self.tree.root_node.parent_node = None
-                break
         # Run simulations
         if self.num_of_simulation != 0:
             for i in range(self.num_of_simulation):
                 if self.time_limit is not None and time.time() - start_time >= self.time_limit:
                     break
-                for child_node in self.tree.root_node.child_nodes:
-                    # Early stop
-                    if child_node.total_reward == math.inf:
-                        print("Inf move found")
-                        self.best_node = child_node
-                        return child_node.move
+                # Early stop
+                proven_node = self.tree.get_proven_win_node()
+                if proven_node is not None:
+                    print("Inf move found")
+                    self.best_node = proven_node
+                    return proven_node.move
                 
                 # a = time.time()
                 self.tree.simulation()
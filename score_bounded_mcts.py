@@ -0,0 +1,148 @@
+from monte_carlo_tree_search import MCTS, Node
+import math
+import config
+
+
+class ScoreBoundedMCTS(MCTS):
+    """
+    Score bounded MCTS: every node has a pessimistic and an optimistic bound of its score (-1 loss, 0 draw, 1 win for the
+    player who moved into it), so wins, draws and losses are all proven
+
+    A node is solved when its bounds are equal. A child node that cannot give more than the pessimistic bound of the
+    player to move is pruned from the selection, and the search of a solved root node stops.
+    """
+    def __init__(self, root_game_state, player_id, rollouts_per_leaf=config.rollouts_per_leaf, rollout_workers=config.rollout_workers):
+        self.root_node = ScoreBoundedNode(root_game_state, None, player_id)
+        self.transposition_table = None
+        self.root_node.expand()
+        # Player id of the agent, not the current player of each node
+        self.player_id = player_id
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_workers = rollout_workers
+
+    def get_root_score(self):
+        """ Return the proven score of the root node for the player to move (1 win, 0 draw, -1 loss), None if it is not solved """
+        if not self.root_node.is_solved():
+            return None
+        return -self.root_node.pessimistic
+
+    def is_solved(self):
+        return self.root_node.is_solved()
+
+    def get_proven_win_node(self):
+        """ Return the best child node once the root node is solved (win, draw or loss), None otherwise, so that the search stops """
+        if not self.is_solved():
+            return None
+        return self.get_best_node()
+
+    def get_best_node(self):
+        """
+        Get the best child node of root node. Used for making the real move.
+
+        Once the root node is solved, this is a child node that guarantees its score. Otherwise the average reward of a
+        child node is clamped to its bounds, so a proven draw is preferred to a move that is likely to lose.
+        """
+        if self.is_solved():
+            score = -self.root_node.optimistic
+            return next(node for node in self.root_node.child_nodes if node.pessimistic == score)
+        best_node = None
+        max_reward = None
+        for node in self.root_node.child_nodes:
+            if node.visited_times != 0:
+                reward = min(max(node.total_reward / node.visited_times, node.pessimistic), node.optimistic)
+            elif node.is_solved():
+                reward = node.pessimistic
+            else:
+                continue
+            if max_reward is None or reward > max_reward:
+                best_node = node
+                max_reward = reward
+        if best_node is None:
+            # No simulation ran, e.g. the time of the move was already spent, so the child nodes may not exist yet
+            return self.root_node.get_next_child_node()
+        return best_node
+
+    def simulation(self):
+        """ Execute one iteration of simulation (selection + expansion + rollout + backpropagation) """
+        target_node = self.selection()
+        if target_node.visited_times != 0 and target_node.game_state.winner is None and not self.is_full():
+            target_node.expand()
+            target_node = target_node.get_next_child_node()
+        if target_node.is_solved():
+            # The score is known, so it is backed up instead of a rollout, and the bounds of the ancestors are updated
+            target_node.back_propagation(target_node.pessimistic)
+            if target_node.parent_node is not None:
+                target_node.parent_node.update_bounds()
+        else:
+            reward, visits = self.rollout_leaf(target_node)
+            target_node.back_propagation(reward, visits)
+
+
+class ScoreBoundedNode(Node):
+    def __init__(self, game_state, parent_node, player_id):
+        super().__init__(game_state, parent_node, player_id)
+        # Bounds of the score for the player who moved into this node, a terminal node knows its score
+        self.pessimistic = -1
+        self.optimistic = 1
+        if game_state is not None and game_state.winner is not None:
+            # Only the player who moved can win with the move
+            self.pessimistic = self.optimistic = 0 if game_state.winner == 0 else 1
+
+    def is_solved(self):
+        return self.pessimistic == self.optimistic
+
+    def select_slot(self):
+        """
+        Return the index in legal_moves of the child with the best UCB1, see Node.select_slot()
+
+        A child whose optimistic bound is not above the pessimistic bound of the player to move here, -optimistic, cannot
+        change the score of this node, so it is pruned, without computing its UCB1. This includes the solved children.
+        """
+        pessimistic = -self.optimistic
+        log_visited_times = math.log(max(self.visited_times, 1))
+        best_slot = None
+        max_UCB1 = -math.inf
+        for slot, (visited_times, total_reward, child_node) in enumerate(zip(self.child_visits, self.child_rewards, self.children)):
+            if child_node is not None and child_node.optimistic <= pessimistic:
+                continue
+            if visited_times == 0:
+                return slot
+            UCB1 = total_reward / visited_times + config.exploration_weight * math.sqrt(log_visited_times / visited_times)
+            if UCB1 > max_UCB1:
+                best_slot = slot
+                max_UCB1 = UCB1
+        if best_slot is None:
+            # Every child is pruned, i.e. this node is solved, which only happens at the root node
+            return super().select_slot()
+        return best_slot
+
+    def get_bounds_from_children(self):
+        """
+        Return the pessimistic and optimistic bounds of this expanded node from its children
+
+        The player to move here takes the best child, so their bounds are the maximum of the bounds of the children,
+        and a move without a child node may still win. The bounds of this node are the negated ones.
+        """
+        pessimistic = -1
+        optimistic = -1
+        for child_node in self.children:
+            if child_node is None:
+                optimistic = 1
+            else:
+                pessimistic = max(pessimistic, child_node.pessimistic)
+                optimistic = max(optimistic, child_node.optimistic)
+        return -optimistic, -pessimistic
+
+    def update_bounds(self):
+        """ Update the bounds of this node and of its ancestors from their children, up to the first node that does not change """
+        node = self
+        while node is not None and node.legal_moves:
+            pessimistic, optimistic = node.get_bounds_from_children()
+            if pessimistic == node.pessimistic and optimistic == node.optimistic:
+                break
+            node.pessimistic = pessimistic
+            node.optimistic = optimistic
+            node = node.parent_node
+
+    def get_new_node(self, game_state, parent_node, player_id):
+        return ScoreBoundedNode(game_state, parent_node, player_id)
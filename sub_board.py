@@ -1,5 +1,30 @@
+from sub_board_table import get_sub_board_table
 import config
 
+# Indices of the lines through each cell for every board size in use, see get_lines_through()
+_lines_through = {}
+
+
+def get_lines_through(board_size):
+    """
+    Return a board_size x board_size grid holding the indices of the lines through each cell
+
+    Row i is line i, column j is line board_size + j, and the two diagonals are lines 2 * board_size and 2 * board_size + 1
+    """
+    if board_size not in _lines_through:
+        grid = [[None for column in range(board_size)] for row in range(board_size)]
+        for i in range(board_size):
+            for j in range(board_size):
+                lines = [i, board_size + j]
+                if i == j:
+                    lines.append(2 * board_size)
+                if i + j == board_size - 1:
+                    lines.append(2 * board_size + 1)
+                grid[i][j] = tuple(lines)
+        _lines_through[board_size] = grid
+    return _lines_through[board_size]
+
+
 class SubBoard:
     """
     A class representing a sub board of the ultimate tic tac toe game
@@ -11,9 +36,45 @@ class SubBoard:
         # None: not yet ended, 0: tie, 1: player 1 is the winner, 2: player 2 is the winner
         self.winner = None
         self.cells = [[None for column in range(self.board_size)] for row in range(self.board_size)]
+        # The state of the cells in the precomputed table of outcomes, see sub_board_table.py
+        self.table = get_sub_board_table(self.board_size)
+        self.state = 0
+        # Without a table (large board sizes), the number of cells taken by each player on every line, so that make_move()
+        # only checks the lines through the move
+        self.lines_through = get_lines_through(self.board_size)
+        if self.table is None:
+            self.line_counts = [[0] * (2 * self.board_size + 2), [0] * (2 * self.board_size + 2)]
+        else:
+            self.line_counts = None
+        self.number_of_moves = 0
+        self.empty_cells = {(x, y) for x in range(self.board_size) for y in range(self.board_size)}
+
+    def clone(self):
+        """ Return a copy of this sub-board, much cheaper than deepcopy """
+        sub_board = SubBoard.__new__(SubBoard)
+        sub_board.board_size = self.board_size
+        sub_board.winner = self.winner
+        sub_board.cells = [row[:] for row in self.cells]
+        sub_board.lines_through = self.lines_through
+        sub_board.table = self.table
+        sub_board.state = self.state
+        if self.line_counts is None:
+            sub_board.line_counts = None
+        else:
+            sub_board.line_counts = [self.line_counts[0][:], self.line_counts[1][:]]
+        sub_board.number_of_moves = self.number_of_moves
+        sub_board.empty_cells = self.empty_cells.copy()
+        return sub_board
     
     def make_move(self, player, coor):
         """ If a move is made successfully, return True, else return False """
+        if not self.is_valid_move(player, coor):
+            return False
+        self.apply_legal_move(player, coor)
+        return True
+
+    def is_valid_move(self, player, coor):
+        """ Return True if player can move on coor, else print the reason and return False """
         if self.winner is not None:
             print("Invalid Board")
             return False
@@ -26,24 +87,67 @@ class SubBoard:
         if self.cells[coor[0]][coor[1]] is not None:
             print("Cell occupied")
             return False
+        return True
 
+    def apply_legal_move(self, player, coor):
+        """ Make a move without any check, coor must be an empty cell of a sub-board that is not yet decided """
         self.cells[coor[0]][coor[1]] = player
-        winner = self.get_winner()
-        if winner is not None:
-            self.winner = winner
-        return True
+        self.empty_cells.remove(coor)
+        self.number_of_moves += 1
+        if self.table is not None:
+            self.state += player * self.table.powers[coor[0] * self.board_size + coor[1]]
+            self.winner = self.table.winners[self.state]
+            return
+        line_counts = self.line_counts[player - 1]
+        for line in self.lines_through[coor[0]][coor[1]]:
+            line_counts[line] += 1
+            if line_counts[line] == self.board_size:
+                self.winner = player
+        if self.winner is None and self.number_of_moves == self.board_size * self.board_size:
+            self.winner = 0
+
+    def undo_move(self, coor):
+        """ Empty the cell of the last move made on this sub-board """
+        player = self.cells[coor[0]][coor[1]]
+        self.cells[coor[0]][coor[1]] = None
+        self.empty_cells.add(coor)
+        self.number_of_moves -= 1
+        if self.table is not None:
+            self.state -= player * self.table.powers[coor[0] * self.board_size + coor[1]]
+        else:
+            line_counts = self.line_counts[player - 1]
+            for line in self.lines_through[coor[0]][coor[1]]:
+                line_counts[line] -= 1
+        # Moves can only be made on sub-boards that are not yet decided
+        self.winner = None
     
     def get_all_empty_cells(self):
         """ Return a list of empty cells, e.g. [(0,0), (1,2)] """
-        empty_cells = []
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                if self.cells[i][j] is None:
-                    empty_cells.append((i, j))
-        return empty_cells
+        return list(self.empty_cells)
     
+    def get_winning_cells(self, player):
+        """ Return the empty cells on which player would win this sub-board, e.g. [(0,2)] """
+        if self.winner is not None:
+            return []
+        if self.table is not None:
+            mask = self.table.winning_cells[player - 1][self.state]
+            return [coor for coor in self.empty_cells if mask >> (coor[0] * self.board_size + coor[1]) & 1]
+        # The cell completes a line with board_size - 1 cells of player and none of the opponent
+        line_counts = self.line_counts[player - 1]
+        opponent_line_counts = self.line_counts[2 - player]
+        return [coor for coor in self.empty_cells
+                if any(line_counts[line] == self.board_size - 1 and opponent_line_counts[line] == 0
+                       for line in self.lines_through[coor[0]][coor[1]])]
+
     def get_winner(self):
-        """ Return Winner if game ends (0: draw, 1: player 1, 2: player 2), return None otherwise"""
+        """
+        Return Winner if game ends (0: draw, 1: player 1, 2: player 2), return None otherwise
+
+        This is a lookup in the table of outcomes, or a scan of the whole sub-board for board sizes without a table.
+        make_move() keeps self.winner up to date without calling it.
+        """
+        if self.table is not None:
+            return self.table.winners[self.state]
         diag_1 = []
         diag_2 = []
         for i in range(self.board_size):
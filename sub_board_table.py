@@ -0,0 +1,115 @@
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+import config
+
+# Sub-board tables for every board size in use, see get_sub_board_table()
+_sub_board_tables = {}
+# A table has 3 ** (board_size ** 2) entries, so it is only built up to this board size
+MAX_BOARD_SIZE = 3
+
+
+class SubBoardTable:
+    """
+    The outcome and the immediately winning cells of every state of a sub-board
+
+    Cells are numbered x * board_size + y, and the state of a sub-board is the sum of player * 3 ** cell over its taken
+    cells, so it can be updated with one addition per move (see powers). winners[state] is None, 0 (draw), 1 or 2 like
+    SubBoard.winner, and winning_cells[player - 1][state] is the bit mask of the empty cells on which player would win
+    the sub-board (0 once it is decided).
+    """
+    def __init__(self, board_size, winners, winning_cells):
+        self.board_size = board_size
+        self.powers = [3 ** i for i in range(board_size * board_size)]
+        self.winners = winners
+        self.winning_cells = winning_cells
+        # ternary[mask] is the state of a sub-board with player 1 on the cells of mask, add 2 * ternary[mask_2] for player 2
+        self.ternary = [sum(self.powers[i] for i in range(board_size * board_size) if mask >> i & 1) for mask in range(1 << board_size * board_size)]
+
+    def __reduce__(self):
+        # Boards sent to other processes refer to the table of the receiving process instead of carrying a copy
+        return get_sub_board_table, (self.board_size,)
+
+    @classmethod
+    def build(cls, board_size):
+        """ Return the table of a board size, computed from scratch """
+        number_of_cells = board_size * board_size
+        powers = [3 ** i for i in range(number_of_cells)]
+        lines = [[i * board_size + j for j in range(board_size)] for i in range(board_size)]
+        lines += [[i * board_size + j for i in range(board_size)] for j in range(board_size)]
+        lines.append([i * board_size + i for i in range(board_size)])
+        lines.append([i * board_size + board_size - 1 - i for i in range(board_size)])
+
+        winners = []
+        for state in range(3 ** number_of_cells):
+            cells = [state // power % 3 for power in powers]
+            winner = None
+            for line in lines:
+                if cells[line[0]] != 0 and all(cells[i] == cells[line[0]] for i in line):
+                    winner = cells[line[0]]
+                    break
+            if winner is None and 0 not in cells:
+                winner = 0
+            winners.append(winner)
+
+        winning_cells = [[0] * len(winners), [0] * len(winners)]
+        for state, winner in enumerate(winners):
+            if winner is not None:
+                continue
+            for i, power in enumerate(powers):
+                if state // power % 3 == 0:
+                    for player in (1, 2):
+                        if winners[state + player * power] == player:
+                            winning_cells[player - 1][state] |= 1 << i
+        return cls(board_size, winners, winning_cells)
+
+    def save(self, path):
+        """ Write the table to a temporary file next to path, then move it to path, so a reader never sees a partial file """
+        winners = np.array([-1 if winner is None else winner for winner in self.winners], dtype=np.int8)
+        descriptor, temporary_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                np.savez(file, winners=winners, winning_cells=np.array(self.winning_cells, dtype=np.int64))
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    @classmethod
+    def load(cls, path, board_size):
+        with np.load(path) as data:
+            winners = [None if winner == -1 else winner for winner in data['winners'].tolist()]
+            winning_cells = data['winning_cells'].tolist()
+        return cls(board_size, winners, winning_cells)
+
+
+def get_sub_board_table(board_size=config.board_size):
+    """
+    Return the SubBoardTable of a board size, or None if the board size is too large for a table
+
+    The table is loaded from config.table_directory, or built and saved there on first use.
+    """
+    if board_size > MAX_BOARD_SIZE:
+        return None
+    if board_size not in _sub_board_tables:
+        path = os.path.join(config.table_directory, "sub_board_table_" + str(board_size) + ".npz")
+        table = None
+        if os.path.exists(path):
+            try:
+                table = SubBoardTable.load(path, board_size)
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+                # A damaged cache is rebuilt
+                table = None
+        if table is None:
+            table = SubBoardTable.build(board_size)
+            try:
+                os.makedirs(config.table_directory, exist_ok=True)
+                table.save(path)
+            except OSError:
+                # The table still works without the cache
+                pass
+        _sub_board_tables[board_size] = table
+    return _sub_board_tables[board_size]
@@ -0,0 +1,59 @@
+import random
+
+from bitboard import BitBoard
+from main_board import MainBoard
+
+
+def get_state(board):
+    return (board.player_masks, board.won_masks, board.drawn_mask, board.allowed_mask, board.winner, board.current_move,
+            board.current_player, board.zobrist_key)
+
+
+def test_play_random_game_matches_moves_made_one_by_one():
+    """ The fast loop of play_random_game() ends in the same state as apply_cell(), which it skips """
+    for seed in range(100):
+        random.seed(seed)
+        board = BitBoard(3)
+        board.play_random_game()
+        random.seed(seed)
+        board_with_features = BitBoard(3)
+        features = board_with_features.get_features()
+        board_with_features.play_random_game()
+        assert get_state(board) == get_state(board_with_features)
+        board_with_features.features = None
+        assert (board_with_features.get_features() == features).all()
+
+
+def test_play_random_game_from_main_board_position():
+    random.seed(0)
+    for _ in range(50):
+        main_board = MainBoard(3)
+        for _ in range(random.randrange(40)):
+            if main_board.winner is not None:
+                break
+            main_board.apply_legal_move(*random.choice(main_board.get_legal_moves()))
+        board = BitBoard.from_main_board(main_board)
+        winner = board.play_random_game()
+        assert winner in (0, 1, 2)
+        assert board.winner == winner and board.get_legal_moves() == []
+
+
+def test_features_updated_by_moves_match_a_rebuild():
+    random.seed(0)
+    for _ in range(20):
+        main_board = MainBoard(3)
+        main_board.get_features()
+        board = BitBoard(3)
+        board.get_features()
+        while board.winner is None:
+            move = random.choice(board.get_legal_moves())
+            board.push(move)
+            main_board.push(move)
+            if random.random() < 0.3:
+                board.pop()
+                main_board.pop()
+            features = board.features.copy()
+            board.features = None
+            assert (board.get_features() == features).all()
+            assert (features == main_board.features).all()
+        assert (BitBoard.from_main_board(main_board).features == board.features).all()
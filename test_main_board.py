@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from main_board import MainBoard
+
+
+def get_lines(board_size):
+    """ Return the rows, columns and diagonals of a board as lists of (x, y) """
+    lines = [[(i, j) for j in range(board_size)] for i in range(board_size)]
+    lines += [[(i, j) for i in range(board_size)] for j in range(board_size)]
+    lines.append([(i, i) for i in range(board_size)])
+    lines.append([(i, board_size - 1 - i) for i in range(board_size)])
+    return lines
+
+
+def scan_sub_board_winner(sub_board):
+    """ Return the winner of a sub-board from its cells, like SubBoard.get_winner() without the table """
+    for line in get_lines(sub_board.board_size):
+        values = {sub_board.cells[x][y] for x, y in line}
+        if len(values) == 1 and None not in values:
+            return values.pop()
+    if all(cell is not None for row in sub_board.cells for cell in row):
+        return 0
+    return None
+
+
+def check_incremental_state(main_board, sub_board_coor=None):
+    """ Check the winners and line counters kept by the moves against a scan of the board """
+    assert main_board.winner == main_board.get_winner()
+    if sub_board_coor is None:
+        sub_board_coors = [(x, y) for x in range(main_board.board_size) for y in range(main_board.board_size)]
+    else:
+        sub_board_coors = [sub_board_coor]
+    for x, y in sub_board_coors:
+        sub_board = main_board.sub_boards[x][y]
+        assert sub_board.winner == scan_sub_board_winner(sub_board)
+        assert main_board.sub_board_values[x][y] == sub_board.winner
+        if sub_board.line_counts is not None:
+            for player in (1, 2):
+                assert sub_board.line_counts[player - 1] == [sum(sub_board.cells[i][j] == player for i, j in line) for line in get_lines(sub_board.board_size)]
+    lines = get_lines(main_board.board_size)
+    for player in (1, 2):
+        assert main_board.line_counts[player - 1] == [sum(main_board.sub_board_values[x][y] == player for x, y in line) for line in lines]
+    assert main_board.line_draws == [sum(main_board.sub_board_values[x][y] == 0 for x, y in line) for line in lines]
+    assert main_board.number_of_blocked_lines == sum(main_board.is_line_blocked(line) for line in range(len(lines)))
+
+
+def get_snapshot(main_board):
+    return (main_board.winner, main_board.current_player, main_board.cells_key, [row[:] for row in main_board.sub_board_values],
+            [counts[:] for counts in main_board.line_counts], main_board.line_draws[:], main_board.number_of_blocked_lines,
+            [[sub_board.winner for sub_board in row] for row in main_board.sub_boards])
+
+
+@pytest.mark.parametrize('board_size', [3, 4, 5, 6])
+def test_incremental_winner_matches_full_scan(board_size):
+    random.seed(board_size)
+    for _ in range(3):
+        main_board = MainBoard(board_size)
+        while main_board.winner is None:
+            main_board_coor, sub_board_coor = random.choice(main_board.get_legal_moves())
+            assert main_board.make_move(main_board_coor, sub_board_coor)
+            check_incremental_state(main_board, main_board_coor)
+        check_incremental_state(main_board)
+
+
+@pytest.mark.parametrize('board_size', [3, 4, 5, 6])
+def test_push_pop_round_trip_restores_incremental_state(board_size):
+    random.seed(board_size)
+    main_board = MainBoard(board_size)
+    while main_board.winner is None:
+        # Play a few moves ahead and take them back, the state must be the same as before
+        snapshot = get_snapshot(main_board)
+        number_of_moves = 0
+        while main_board.winner is None and number_of_moves < 8:
+            move = random.choice(main_board.get_legal_moves())
+            main_board.push(move)
+            number_of_moves += 1
+            check_incremental_state(main_board, move[0])
+        for _ in range(number_of_moves):
+            move = main_board.pop()
+            check_incremental_state(main_board, move[0])
+        assert get_snapshot(main_board) == snapshot
+        main_board.push(random.choice(main_board.get_legal_moves()))
+    check_incremental_state(main_board)
+
+
+@pytest.mark.parametrize('board_size', [3, 4])
+def test_features_updated_by_moves_match_a_rebuild(board_size):
+    random.seed(board_size)
+    main_board = MainBoard(board_size)
+    main_board.get_features()
+    while main_board.winner is None:
+        main_board.push(random.choice(main_board.get_legal_moves()))
+        if random.random() < 0.3:
+            main_board.pop()
+        features = main_board.features.copy()
+        main_board.features = None
+        assert (main_board.get_features() == features).all()
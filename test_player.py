@@ -0,0 +1,74 @@
+import random
+import time
+
+from main_board import MainBoard
+from player import MCTSPlayer, MCTSSolverPlayer, ScoreBoundedPlayer, MCRAVEPlayer, HMCRAVEPlayer
+
+
+def push_random_moves(main_board, number_of_moves):
+    for _ in range(number_of_moves):
+        main_board.push(random.choice(main_board.get_legal_moves()))
+
+
+def get_forced_position():
+    """ Return a main board after random moves made with make_move(), where the player to move has one legal move """
+    random.seed(0)
+    while True:
+        main_board = MainBoard(3)
+        while main_board.winner is None:
+            legal_moves = main_board.get_legal_moves()
+            if len(legal_moves) == 1:
+                return main_board
+            main_board.make_move(*random.choice(legal_moves))
+
+
+def test_update_root_rebuilds_tree_for_pushed_moves():
+    """ The moves pushed on the main board are not in its history, so the tree is built again from its position """
+    random.seed(0)
+    main_board = MainBoard(3)
+    push_random_moves(main_board, 4)
+    player = MCTSPlayer(main_board, main_board.current_player, num_of_simulation=50)
+    for number_of_moves in (2, 1, 1):
+        push_random_moves(main_board, number_of_moves)
+        number_of_nodes = player.tree.get_number_of_nodes()
+        move = player.get_move()
+        assert player.tree.root_node.game_state.current_move == main_board.current_move
+        assert player.freed_nodes == number_of_nodes
+        assert move in main_board.get_legal_moves()
+
+
+def test_can_stop_early_counts_the_visits_of_several_rollouts_per_leaf():
+    """ With 96 simulations left, a lead of 104 visits is safe for one rollout per leaf, but not for 8 """
+    for rollouts_per_leaf, can_stop in ((1, True), (8, False)):
+        player = MCTSPlayer(MainBoard(3), 1, num_of_simulation=400, rollouts_per_leaf=rollouts_per_leaf)
+        root_node = player.tree.root_node
+        root_node.get_next_child_node().back_propagation(104, 208)
+        root_node.get_next_child_node().back_propagation(0, 104)
+        start_time = time.time()
+        assert player.can_stop_early(304, start_time) == can_stop
+        player.add_saved_rollouts(304, start_time)
+        assert player.saved_rollouts == 96 * rollouts_per_leaf
+
+
+def test_forced_move_is_played_without_search():
+    """ A move without a choice gets no time from the time manager, it is returned before any search or worker starts """
+    main_board = get_forced_position()
+    forced_move = main_board.get_legal_moves()[0]
+    for player_class in (MCTSPlayer, MCTSSolverPlayer, ScoreBoundedPlayer):
+        player = player_class(main_board, main_board.current_player, total_time=5)
+        assert player.get_move() == forced_move
+        # Only the root node and the child node of the move
+        assert player.tree.get_number_of_nodes() == 2
+    player = MCTSPlayer(main_board, main_board.current_player, workers=2, total_time=5)
+    assert player.get_move() == forced_move
+
+
+def test_spent_total_time_runs_no_simulation():
+    """ The clock is checked before the first simulation, and every MCTS player takes total_time """
+    for player_class in (MCTSPlayer, MCTSSolverPlayer, ScoreBoundedPlayer, MCRAVEPlayer, HMCRAVEPlayer):
+        main_board = MainBoard(3)
+        player = player_class(main_board, 1, total_time=0)
+        simulations = []
+        player.tree.simulation = lambda: simulations.append(1)
+        assert player.get_move() in main_board.get_legal_moves()
+        assert simulations == []
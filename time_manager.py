@@ -0,0 +1,84 @@
+import math
+import time
+
+import config
+
+
+class TimeManager:
+    """
+    Splits the total time of a player for a game over its moves
+
+    The target time of a move is the remaining time divided by the estimated number of moves this player has left,
+    scaled by the branching factor of the position. Once the target time is spent, the search stops as soon as the most
+    visited child of the root node has been the same for config.stable_time of the target time, and it always stops at
+    the hard deadline of the move, a few times the target time but never more than a fraction of the remaining time.
+    """
+    def __init__(self, total_time, board_size=config.board_size):
+        self.remaining_time = total_time
+        self.board_size = board_size
+        # The clock of the current move, see start_move()
+        self.start_time = None
+        self.target_time = 0
+        self.deadline = None
+        # The most visited child move of the root node at the last check, and since when it is
+        self.best_move = None
+        self.best_move_time = None
+
+    def get_moves_to_go(self, main_board):
+        """ Return the estimated number of moves this player has left in the game of main_board """
+        expected_moves = config.expected_game_length * self.board_size ** 4
+        return max(config.minimum_moves_to_go, (expected_moves - main_board.current_move) / 2)
+
+    def start_move(self, main_board):
+        """ Start the clock of the move of main_board, and set its target time and hard deadline """
+        self.start_time = time.monotonic()
+        self.best_move = None
+        self.best_move_time = self.start_time
+        number_of_legal_moves = len(main_board.get_legal_moves())
+        # Keep a margin for the simulations run between two checks of the clock and the time around the search
+        available_time = max(self.remaining_time - config.time_margin, 0)
+        if number_of_legal_moves <= 1:
+            # There is nothing to choose
+            self.target_time = 0
+            self.deadline = self.start_time
+            return
+        # A move sent to an open main board has up to 9 times more choices than a move in one sub-board
+        branching = min(max(math.sqrt(number_of_legal_moves / self.board_size ** 2), 0.5), 2)
+        self.target_time = available_time / self.get_moves_to_go(main_board) * branching
+        move_time = min(self.target_time * config.time_extension, available_time * config.maximum_time_fraction)
+        self.target_time = min(self.target_time, move_time)
+        self.deadline = self.start_time + move_time
+
+    def get_time_left(self):
+        """ Return the target time left for the current move, for searches that only take a time limit """
+        return self.target_time - (time.monotonic() - self.start_time)
+
+    def get_time_to_deadline(self):
+        """ Return the time left before the hard deadline of the current move """
+        return self.deadline - time.monotonic()
+
+    def should_stop(self, root_node):
+        """
+        Return True if the search of the current move should stop
+
+        It is called every config.time_check_interval simulations, see MCTSPlayer.run_simulations().
+        """
+        now = time.monotonic()
+        if now >= self.deadline:
+            return True
+        best_move = None
+        max_visits = -1
+        for child_node in root_node.child_nodes:
+            if child_node.visited_times > max_visits:
+                best_move = child_node.move
+                max_visits = child_node.visited_times
+        if best_move != self.best_move:
+            self.best_move = best_move
+            self.best_move_time = now
+        return now - self.start_time >= self.target_time and now - self.best_move_time >= self.target_time * config.stable_time
+
+    def end_move(self):
+        """ Stop the clock of the current move, and take the time it used from the remaining time """
+        if self.start_time is not None:
+            self.remaining_time -= time.monotonic() - self.start_time
+            self.start_time = None
@@ -12,7 +12,6 @@ from mcts_alpha import MCTSAlpha
 from player import MCTSAlphaPlayer
 import config
 from neural_network import NeuralNetwork
-import utils
 import os
 import time
 import matplotlib.pyplot as plt
@@ -225,18 +224,9 @@ class Train:
             main_board_coor, sub_board_coor = current_player.get_move(True)
             action_prob = current_player.get_prob()
 
-            legal_moves = game_state.get_legal_moves()
-            legal_moves_array = []
-            for i in range(81):
-                if utils.index_to_move(i) in legal_moves:
-                    legal_moves_array.append(1)
-                else:
-                    legal_moves_array.append(0)
-
-            # The array to be input into the neural network
-            player1_array, player2_array = game_state.to_array()
-            input_array = player1_array + player2_array + legal_moves_array + [game_state.current_player - 1]
-            temp_data.append([np.array(input_array), np.array(action_prob), 0])
+            # The array to be input into the neural network, copied because the board updates it in place
+            input_array = game_state.get_features().copy()
+            temp_data.append([input_array, np.array(action_prob), 0])
             
             current_player.make_move(main_board_coor, sub_board_coor)
             current_player = player_1 if current_player == player_2 else player_2
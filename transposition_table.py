@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+import config
+
+
+class TranspositionTable:
+    """
+    A bounded map from positions to search tree nodes, so that the statistics of a position reached through different
+    move orders are shared by all its parents
+
+    Entries are keyed by the Zobrist key of the position alone. A shared node keeps no move of its own, its move is the
+    edge from the parent node it is reached from (see Node.move). When the table is full, the least recently used
+    entry is replaced. Dropping an entry only stops further sharing of its node, the node stays in the tree.
+    """
+    def __init__(self, capacity=config.transposition_table_size):
+        self.capacity = capacity
+        self.nodes = OrderedDict()
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, key):
+        """ Return the node stored for key, or None """
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+            self.hits += 1
+        return node
+
+    def retain(self, node_ids):
+        """ Remove the entries whose node is not in node_ids, a set of id() of nodes, e.g. the nodes still in the tree """
+        for key in [key for key, node in self.nodes.items() if id(node) not in node_ids]:
+            del self.nodes[key]
+
+    def store(self, key, node):
+        """ Store a node, replacing the least recently used entry if the table is full """
+        self.nodes[key] = node
+        if len(self.nodes) > self.capacity:
+            self.nodes.popitem(last=False)
@@ -1,5 +1,10 @@
 import numpy as np
 
+import config
+
+# Move tables for every board size in use, see get_move_table()
+_move_tables = {}
+
 
 def softmax(x):
     probs = np.exp(x - np.max(x))
@@ -7,19 +12,55 @@ def softmax(x):
     return probs
 
 
-def index_to_move(i):
-    main_board_x = int(i / 27)
-    if main_board_x == 3:
-        move = ((2, 2), (2, 2))
-    else:
-        main_board_y = int((i - 27 * main_board_x) / 9)
-        if main_board_y == 3:
-            move = ((main_board_x, 2), (2, 2))
-        else:
-            sub_board_x = int((i - 27 * main_board_x - 9 * main_board_y) / 3)
-            if sub_board_x == 3:
-                move = ((main_board_x, main_board_y), (2, 2))
-            else:
-                sub_board_y = int((i - 27 * main_board_x - 9 * main_board_y - 3 * sub_board_x))
-                move = ((main_board_x, main_board_y), (sub_board_x, sub_board_y))
-    return move
+class MoveTable:
+    """
+    Integer ids of the moves of a board size, with precomputed lookups in both directions
+
+    The id of ((main_x, main_y), (sub_x, sub_y)) is ((main_x * n + main_y) * n + sub_x) * n + sub_y, where n is the
+    board size, so ids run from 0 to n ** 4 - 1 and are the indices of the policy output of the neural network.
+    """
+    def __init__(self, board_size):
+        self.board_size = board_size
+        self.number_of_moves = board_size ** 4
+        coors = [(x, y) for x in range(board_size) for y in range(board_size)]
+        # moves[i] is the move with id i, ids[move] is the id of a move
+        self.moves = [(main_board_coor, sub_board_coor) for main_board_coor in coors for sub_board_coor in coors]
+        self.ids = {move: i for i, move in enumerate(self.moves)}
+
+    def get_ids(self, moves):
+        """ Return the ids of a list of moves as an integer array """
+        return np.fromiter((self.ids[move] for move in moves), dtype=np.intp, count=len(moves))
+
+    def get_mask(self, moves):
+        """ Return an array with 1 at the ids of the given moves and 0 elsewhere """
+        mask = np.zeros(self.number_of_moves)
+        mask[self.get_ids(moves)] = 1
+        return mask
+
+
+def get_move_table(board_size=config.board_size):
+    """ Return the MoveTable of a board size, building it on first use """
+    if board_size not in _move_tables:
+        _move_tables[board_size] = MoveTable(board_size)
+    return _move_tables[board_size]
+
+
+def get_node_budget(bytes_per_node):
+    """
+    Return the largest number of nodes allowed in a search tree by config.max_tree_nodes and config.max_tree_bytes, or
+    None if there is no limit
+    """
+    budgets = []
+    if config.max_tree_nodes is not None:
+        budgets.append(config.max_tree_nodes)
+    if config.max_tree_bytes is not None:
+        budgets.append(config.max_tree_bytes // bytes_per_node)
+    return min(budgets) if budgets else None
+
+
+def index_to_move(i, board_size=config.board_size):
+    return get_move_table(board_size).moves[i]
+
+
+def move_to_index(move, board_size=config.board_size):
+    return get_move_table(board_size).ids[move]
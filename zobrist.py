@@ -0,0 +1,33 @@
+import random
+
+import config
+
+# Zobrist keys for every (board size, seed) in use, see get_zobrist_keys()
+_zobrist_keys = {}
+
+
+class ZobristKeys:
+    """
+    The random 64-bit keys that are xor-ed together into the Zobrist key of a position
+
+    A position is keyed by its cells, its allowed sub-boards and the player to move. Sub-boards and cells are
+    numbered x * board_size + y. The keys only depend on the board size and the seed, so the same position has the
+    same key in every process.
+    """
+    def __init__(self, board_size, seed):
+        rng = random.Random("zobrist-" + str(board_size) + "-" + str(seed))
+        number_of_cells = board_size ** 4
+        # cells[0][i] is the key of player 1 on cell i of the whole board (sub-board * board_size ** 2 + cell)
+        self.cells = [[rng.getrandbits(64) for _ in range(number_of_cells)] for player in range(2)]
+        self.allowed_sub_boards = [rng.getrandbits(64) for _ in range(board_size * board_size)]
+        # Included when player 2 is to move
+        self.player_2 = rng.getrandbits(64)
+        # A move flips its cell and the player to move, so moves[0][i] is cells[0][i] ^ player_2
+        self.moves = [[key ^ self.player_2 for key in self.cells[player]] for player in range(2)]
+
+
+def get_zobrist_keys(board_size, seed=config.zobrist_seed):
+    """ Return the ZobristKeys of a board size, building them on first use """
+    if (board_size, seed) not in _zobrist_keys:
+        _zobrist_keys[(board_size, seed)] = ZobristKeys(board_size, seed)
+    return _zobrist_keys[(board_size, seed)]